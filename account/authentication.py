@@ -0,0 +1,80 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# при недоступном Redis пользователь читается из БД, а не получает 401
+CACHE_ERRORS = (RedisError, OSError)
+
+# только то, что нужно сериализаторам и permissions; остальные поля догрузятся при обращении
+SNAPSHOT_FIELDS = ['email', 'name', 'is_active', 'is_staff']
+
+
+def token_key(key):
+    return f'auth:token:{key}'
+
+
+def forget_keys(keys):
+    keys = [token_key(key) for key in keys]
+    if keys:
+        # после коммита, иначе параллельный запрос успеет положить старый снимок
+        transaction.on_commit(lambda: delete_snapshots(keys))
+
+
+def delete_snapshots(keys):
+    try:
+        cache.delete_many(keys)
+    except CACHE_ERRORS:
+        # снимок удалённого токена проживёт не дольше AUTH_TOKEN_CACHE_TIMEOUT
+        logger.exception('Кеш недоступен, снимки токенов не удалены')
+
+
+def forget_tokens(user):
+    forget_keys(Token.objects.filter(user=user).values_list('key', flat=True))
+
+
+def revoke_tokens(user):
+    """Удаляет токены пользователя, снимки из кеша убираются после коммита удаления."""
+    with transaction.atomic():
+        keys = list(Token.objects.filter(user=user).values_list('key', flat=True))
+        Token.objects.filter(key__in=keys).delete()
+        forget_keys(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который держит снимок token -> пользователь в общем кеше.
+
+    request.auth - несохранённый Token(key, user) без created: сам токен из БД не читается.
+    Если кеш недоступен, пользователь читается из БД, как в TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        try:
+            snapshot = cache.get(token_key(key))
+        except CACHE_ERRORS:
+            logger.exception('Кеш недоступен, токен проверяется по БД')
+            snapshot = None
+        if snapshot is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            snapshot = [getattr(token.user, field) for field in SNAPSHOT_FIELDS]
+            try:
+                cache.set(token_key(key), snapshot, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            except CACHE_ERRORS:
+                logger.exception('Кеш недоступен, снимок токена не сохранён')
+        user = User.from_db('default', SNAPSHOT_FIELDS, snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
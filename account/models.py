@@ -1,5 +1,7 @@
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
 
 
 class UserManager(BaseUserManager):
@@ -54,9 +56,44 @@ class User(AbstractBaseUser):
 
     @staticmethod
     def send_activation_mail(email, code):
-        from django.core.mail import send_mail
         message = f'Ваш код активации: {code}'
-        send_mail('Активация аккаунта',
-                  message,
-                  'test@gmail.com',
-                  [email])
+        OutgoingMail.queue('Активация аккаунта',
+                           message,
+                           'test@gmail.com',
+                           email)
+
+
+class OutgoingMail(models.Model):
+    # исходящие письма пишутся в той же транзакции, что и изменения пользователя,
+    # отправляет их account.tasks.send_outbox
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.EmailField()
+    to = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['sent_at', 'next_attempt_at'], name='outbox_pending_idx')]
+
+    def __str__(self):
+        return f'{self.to} --- {self.subject}'
+
+    @staticmethod
+    def queue(subject, message, from_email, to):
+        # account.tasks сам импортирует OutgoingMail
+        from .tasks import send_outbox
+
+        mail = OutgoingMail.objects.create(subject=subject, message=message, from_email=from_email, to=to)
+
+        def notify_worker():
+            # если брокер недоступен, письмо заберёт периодический send_outbox
+            try:
+                send_outbox.delay()
+            except OperationalError:
+                pass
+        transaction.on_commit(notify_worker)
+        return mail
@@ -1,8 +1,11 @@
 
 from django.contrib.auth import get_user_model, authenticate
-from django.core.mail import send_mail
+from django.db import transaction
 from rest_framework import serializers
 
+from .authentication import forget_tokens
+from .models import OutgoingMail
+
 
 User = get_user_model()
 
@@ -25,6 +28,7 @@ class RegistrationSerializer(serializers.Serializer):
             raise serializers.ValidationError('Пароли не совпадают')
         return attrs
 
+    @transaction.atomic
     def create(self):
         attrs = self.validated_data
         user = User.objects.create_user(**attrs)
@@ -61,6 +65,7 @@ class ActivationSerializer(serializers.Serializer):
         user.is_active = True
         user.activation_code = ''
         user.save()
+        forget_tokens(user)
 
 
 class LoginSerializer(serializers.Serializer):
@@ -94,15 +99,16 @@ class ForgotPasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError('Аккаунт не найден')
         return email
 
+    @transaction.atomic
     def send_code(self):
         email = self.validated_data.get('email')
         user = User.objects.get(email=email)
         user.generate_activation_code()
-        send_mail(
+        OutgoingMail.queue(
             'Восстановление пароля',
             f'Ваш код подтверждения: {user.activation_code}',
             'admin@gmail.com',
-            [email]
+            email
         )
 
 
@@ -131,3 +137,4 @@ class ForgotPasswordCompleteSerializer(serializers.Serializer):
         user.set_password(password)
         user.activation_code = ''
         user.save()
+        forget_tokens(user)
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import get_connection, EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingMail
+
+
+@shared_task
+def send_outbox():
+    """Отправляет накопившиеся письма пачками через одно SMTP-соединение."""
+    sent = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked: несколько воркеров не возьмут одно и то же письмо
+            mails = list(OutgoingMail.objects.select_for_update(skip_locked=True).filter(
+                sent_at__isnull=True,
+                next_attempt_at__lte=timezone.now(),
+                attempts__lt=settings.OUTBOX_MAX_ATTEMPTS
+            ).order_by('next_attempt_at')[:settings.OUTBOX_BATCH_SIZE])
+            if not mails:
+                return sent
+            try:
+                connection = get_connection()
+                connection.open()
+            except (SMTPException, OSError) as exc:
+                # SMTP недоступен - откладываем пачку до следующего запуска
+                for mail in mails:
+                    postpone(mail, exc)
+                return sent
+            sent += send_batch(connection, mails)
+        if len(mails) < settings.OUTBOX_BATCH_SIZE:
+            return sent
+
+
+def send_batch(connection, mails):
+    sent = 0
+    try:
+        for mail in mails:
+            try:
+                EmailMessage(mail.subject, mail.message, mail.from_email, [mail.to],
+                             connection=connection).send()
+            except (SMTPException, OSError) as exc:
+                postpone(mail, exc)
+                continue
+            mail.sent_at = timezone.now()
+            mail.save(update_fields=['sent_at'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def postpone(mail, exc):
+    # экспоненциальная задержка: 1, 2, 4, 8... минут
+    mail.attempts += 1
+    mail.next_attempt_at = timezone.now() + timedelta(minutes=2 ** (mail.attempts - 1))
+    mail.last_error = str(exc)
+    mail.save(update_fields=['attempts', 'next_attempt_at', 'last_error'])
@@ -1,3 +1,127 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from account.authentication import CachedTokenAuthentication
+from account.models import OutgoingMail
+from account.tasks import send_outbox
+
+User = get_user_model()
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, email):
+        return self.client.post('/api/v1/register/', {
+            'email': email, 'name': 'User', 'password': '12345678', 'password_confirmation': '12345678'
+        })
+
+    def test_registration_queues_mail_instead_of_sending(self):
+        response = self.register('user@gmail.com')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        queued = OutgoingMail.objects.get()
+        user = User.objects.get(email='user@gmail.com')
+        self.assertEqual(queued.to, 'user@gmail.com')
+        self.assertIn(user.activation_code, queued.message)
+
+        self.assertEqual(send_outbox(), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@gmail.com'])
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.sent_at)
+        self.assertEqual(send_outbox(), 0)
+
+    def test_forgot_password_queues_mail(self):
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        self.client.force_authenticate(user)
+        self.client.post('/api/v1/forgot_password/', {'email': 'user@gmail.com'})
+        self.assertEqual(OutgoingMail.objects.get().subject, 'Восстановление пароля')
+
+    def test_smtp_failure_backs_off(self):
+        self.register('user@gmail.com')
+        with mock.patch('account.tasks.EmailMessage.send', side_effect=SMTPException('down')):
+            self.assertEqual(send_outbox(), 0)
+        queued = OutgoingMail.objects.get()
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(queued.last_error, 'down')
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+        # до next_attempt_at письмо не трогаем
+        self.assertEqual(send_outbox(), 0)
+        OutgoingMail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_outbox(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get('/api/v1/likes/').status_code, 200)
+        # повторный запрос: только сам список лайков, без выборки токена
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/v1/likes/').status_code, 200)
+        self.assertEqual(cache.get(f'auth:token:{self.token.key}'), ['user@gmail.com', 'User', True, False])
+
+    def test_auth_is_token_instance(self):
+        user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, token.key, token.user), (self.user.pk, self.token.key, user))
+
+    def test_cache_outage_falls_back_to_database(self):
+        broken = mock.Mock(**{f'{method}.side_effect': RedisConnectionError('Connection refused')
+                              for method in ('get', 'set', 'delete_many')})
+        with mock.patch('account.authentication.cache', broken), \
+                self.assertLogs('account.authentication', 'ERROR'):
+            self.assertEqual(self.client.get('/api/v1/likes/').status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post('/api/v1/logout/').status_code, 200)
+            self.assertEqual(self.client.get('/api/v1/likes/').status_code, 401)
+
+    def test_logout_invalidates_token(self):
+        self.client.get('/api/v1/likes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/v1/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/likes/').status_code, 401)
+
+    def test_logout_clears_cache_after_token_is_deleted(self):
+        self.client.get('/api/v1/likes/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.client.post('/api/v1/logout/').status_code, 200)
+        # кеш чистится только после коммита удаления токена
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertIsNotNone(cache.get(f'auth:token:{self.token.key}'))
+        for callback in callbacks:
+            callback()
+        with self.assertRaises(AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertIsNone(cache.get(f'auth:token:{self.token.key}'))
 
-# Create your tests here.
+    def test_password_change_invalidates_token(self):
+        self.client.get('/api/v1/likes/')
+        User.objects.filter(pk=self.user.pk).update(activation_code='abcdefgh', is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/v1/forgot_password_complete/', {
+                'email': 'user@gmail.com', 'code': 'abcdefgh',
+                'password': 'new-password', 'password_confirmation': 'new-password',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(f'auth:token:{self.token.key}'))
+        # следующий запрос берёт свежий снимок пользователя
+        self.client.get('/api/v1/likes/')
+        self.assertEqual(cache.get(f'auth:token:{self.token.key}'), ['user@gmail.com', 'User', True, True])
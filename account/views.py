@@ -1,9 +1,9 @@
-from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .authentication import revoke_tokens
 from .serializers import RegistrationSerializer, ActivationSerializer, LoginSerializer, \
     ForgotPasswordSerializer, ForgotPasswordCompleteSerializer
 
@@ -34,8 +34,7 @@ class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        user = request.user
-        Token.objects.filter(user=user).delete()
+        revoke_tokens(request.user)
         return Response('Вы успешно разлогинились')
 
 
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+
+Async read-эндпоинты (api/v1/async/...) запускаются под uvicorn:
+    uvicorn blog.asgi:application --workers 4
+Сравнение с DRF-вьюхами: python manage.py run_benchmarks --async
 """
 
 import os
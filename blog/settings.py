@@ -7,6 +7,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 from decouple import config
@@ -47,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,6 +131,31 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# как отдавать медиа: 'django' (Range + sendfile через wsgi.file_wrapper),
+# 'x-accel-redirect' (nginx, internal-локейшен MEDIA_ACCEL_PREFIX) или 'x-sendfile' (apache)
+MEDIA_SERVE_MODE = config('MEDIA_SERVE_MODE', default='django')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# варианты постеров для srcset, неподдерживаемые Pillow форматы пропускаются
+IMAGE_VARIANT_WIDTHS = [200, 400, 800]
+IMAGE_VARIANT_FORMATS = ['avif', 'webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = 80
+
+# загрузка трейлеров по частям. Недокачанные файлы лежат вне MEDIA_ROOT, чтобы их нельзя было
+# скачать по /media/; на том же диске, что MEDIA_ROOT, готовый файл переносится без копирования
+VIDEO_UPLOAD_TEMP_DIR = config('VIDEO_UPLOAD_TEMP_DIR', default=os.path.join(BASE_DIR, 'uploads'))
+VIDEO_UPLOAD_MAX_CHUNK = 16 * 1024 * 1024
+VIDEO_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+# HLS-транскодирование трейлеров: (высота, видеобитрейт в кбит/с), выше исходника не кодируем
+FFMPEG_BINARY = config('FFMPEG_BINARY', default='ffmpeg')
+FFPROBE_BINARY = config('FFPROBE_BINARY', default='ffprobe')
+VIDEO_HLS_LADDER = [(1080, 5000), (720, 2800), (480, 1400), (360, 800)]
+VIDEO_HLS_SEGMENT_SECONDS = 6
+# сколько ffmpeg одновременно внутри одной задачи; задачи идут в отдельную очередь,
+# её воркер запускается с ограниченной конкурентностью: celery -A blog worker -Q transcode -c 2
+VIDEO_TRANSCODE_WORKERS = config('VIDEO_TRANSCODE_WORKERS', default=2, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -135,12 +163,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'account.User'
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'main_.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 3,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'account.authentication.CachedTokenAuthentication',
     ]
 }
+# строк в одном куске потоковых JSON-ответов (отзывы поста, выгрузка каталога), см. main_.renderers
+STREAMING_JSON_CHUNK = 500
 
 EMAIL_BACKEND = config('EMAIL_BACKEND')
 EMAIL_HOST = config('EMAIL_HOST')
@@ -149,8 +183,100 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://localhost:6379/1'),
+    }
+}
+if 'test' in sys.argv[1:2]:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# сколько секунд хранить ответы каталога, 0 выключает кеш
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=300, cast=int)
+# сколько секунд хранить снимок пользователя по токену
+AUTH_TOKEN_CACHE_TIMEOUT = config('AUTH_TOKEN_CACHE_TIMEOUT', default=300, cast=int)
+
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_TASK_ROUTES = {
+    'main_.tasks.transcode_video': {'queue': 'transcode'},
+}
+# полки /posts/trending/ и /categories/<slug>/top/, см. main_.leaderboards
+LEADERBOARD_SIZE = 20
+LEADERBOARD_MAX_SIZE = 100
+TOP_RATED_MIN_REVIEWS = config('TOP_RATED_MIN_REVIEWS', default=3, cast=int)
+# trending_score вдвое уменьшается за TRENDING_HALF_LIFE секунд
+TRENDING_HALF_LIFE = config('TRENDING_HALF_LIFE', default=3 * 24 * 60 * 60, cast=int)
+TRENDING_DECAY_INTERVAL = 60 * 60
+TRENDING_MIN_SCORE = 0.01
+
+# похожие посты, см. main_.recommendations
+RECOMMENDATIONS_NEIGHBOURS = 20
+RECOMMENDATIONS_BLOCK_SIZE = config('RECOMMENDATIONS_BLOCK_SIZE', default=1000, cast=int)
+# сколько последних лайков/избранного пользователя берём для /recommendations/
+RECOMMENDATIONS_HISTORY = 100
+
+# статистика оценок, см. main_.rating_stats: сколько "виртуальных" средних оценок
+# добавлять каждому посту и какие перцентили считать по категории
+RATING_PRIOR_WEIGHT = config('RATING_PRIOR_WEIGHT', default=5, cast=int)
+RATING_PERCENTILES = [25, 50, 75, 90]
+
+CELERY_BEAT_SCHEDULE = {
+    'send-outbox': {
+        'task': 'account.tasks.send_outbox',
+        'schedule': 30.0,
+    },
+    'cleanup-video-uploads': {
+        'task': 'main_.tasks.cleanup_video_uploads',
+        'schedule': 60 * 60,
+    },
+    'decay-trending-scores': {
+        'task': 'main_.tasks.decay_trending_scores',
+        'schedule': TRENDING_DECAY_INTERVAL,
+    },
+    'rebuild-rating-stats': {
+        'task': 'main_.tasks.rebuild_rating_stats',
+        'schedule': 10 * 60,
+    },
+    'rebuild-recommendations': {
+        'task': 'main_.tasks.rebuild_recommendations',
+        'schedule': 60 * 60,
+    },
+}
+
+# очередь исходящих писем account.OutgoingMail
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+
+# рассылка о новом фильме: получателей в одной задаче и лимит задач на воркер
+NEW_SERIES_CHUNK_SIZE = config('NEW_SERIES_CHUNK_SIZE', default=500, cast=int)
+NEW_SERIES_RATE_LIMIT = config('NEW_SERIES_RATE_LIMIT', default='10/m')
+# сколько названий перечислять в письме после import_catalogue --digest
+CATALOGUE_DIGEST_TITLES = 50
+
+# метрики по эндпоинтам, см. main_.instrumentation: время пишется всегда, запросы к БД
+# и сериализация - только для доли INSTRUMENTATION_SAMPLE_RATE запросов
+INSTRUMENTATION_ENABLED = config('INSTRUMENTATION_ENABLED', default=True, cast=bool)
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE', default=0.0, cast=float)
+INSTRUMENTATION_SERVER_TIMING = config('INSTRUMENTATION_SERVER_TIMING', default=True, cast=bool)
+# с какого числа одинаковых запросов писать в лог предупреждение о N+1
+INSTRUMENTATION_DUPLICATE_THRESHOLD = 5
+# /api/v1/metrics/ открыт сотрудникам и сборщику метрик с Authorization: Bearer <токен>;
+# пустой токен - только сотрудникам
+INSTRUMENTATION_METRICS_TOKEN = config('INSTRUMENTATION_METRICS_TOKEN', default='')
+
+# профили to_representation, см. main_.profiling: сотрудник включает их заголовком
+# X-Profile / ?profile=, остальные запросы - с вероятностью SERIALIZER_PROFILE_SAMPLE_RATE
+SERIALIZER_PROFILE_SAMPLE_RATE = config('SERIALIZER_PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+# 'cprofile' или 'stack' (семплер стеков, меньше искажает время)
+SERIALIZER_PROFILE_MODE = config('SERIALIZER_PROFILE_MODE', default='stack')
+SERIALIZER_PROFILE_INTERVAL = 0.001
+SERIALIZER_PROFILE_DIR = config('SERIALIZER_PROFILE_DIR', default=os.path.join(tempfile.gettempdir(), 'blog-profiles'))
+SERIALIZER_PROFILE_KEEP = 100
@@ -12,13 +12,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 
 from blog import settings
+from main_.media import serve_media
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -33,7 +33,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/docs/', schema_view.with_ui('swagger')),
     path('api/v1/', include('main_.urls')),
-    path('api/v1/', include('account.urls'))
+    path('api/v1/', include('account.urls')),
+    path(f'{settings.MEDIA_URL}<path:path>', serve_media),
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
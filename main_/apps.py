@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_'
+
+    def ready(self):
+        from main_ import signals  # noqa: F401
@@ -0,0 +1,141 @@
+"""Асинхронные версии горячих read-эндпоинтов для запуска под ASGI (uvicorn).
+
+DRF-вьюха под ASGI целиком, вместе с сериализацией, уходит в поток через
+sync_to_async. Здесь в поток уходят только сами запросы к БД: в Django 4.0
+у QuerySet нет async-методов, и aget/acount/alist - это тоже sync_to_async,
+по переходу на запрос. Разбор запроса, пагинация и рендер списка идут в event loop.
+
+Сравнение с DRF-вьюхами: manage.py run_benchmarks --async.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, HttpResponseNotAllowed, Http404
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+from main_.models import Category, Post
+from main_.renderers import FastJSONRenderer
+from main_.serializers import CategorySerializer, PostReadSerializer, PostListReadSerializer, review_rows
+from main_.views import annotate_post_list
+
+
+# в Django 4.0 у QuerySet ещё нет async-методов: тогда каждый запрос - один переход в поток
+async def aget(queryset, **kwargs):
+    if hasattr(queryset, 'aget'):
+        return await queryset.aget(**kwargs)
+    return await sync_to_async(queryset.get)(**kwargs)
+
+
+async def acount(queryset):
+    if hasattr(queryset, 'acount'):
+        return await queryset.acount()
+    return await sync_to_async(queryset.count)()
+
+
+async def alist(queryset):
+    # prefetch_related при async for не поддерживается, такие выборки читаем одним переходом
+    if hasattr(queryset, '__aiter__') and not queryset._prefetch_related_lookups:
+        return [obj async for obj in queryset]
+    return await sync_to_async(list)(queryset)
+
+
+async def authenticate(request):
+    """Тот же набор DEFAULT_AUTHENTICATION_CLASSES, что и у DRF-вьюх."""
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = await sync_to_async(authentication_class().authenticate)(request)
+        if result is not None:
+            return result[0]
+    return AnonymousUser()
+
+
+def render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def read_view(view):
+    # декораторы из django.views.decorators в 4.0 не умеют оборачивать корутины
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        try:
+            request.user = await authenticate(request)
+        except exceptions.AuthenticationFailed as error:
+            return render({'detail': error.detail}, status=401)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def page_link(request, page, last_page):
+    url = request.build_absolute_uri()
+    if page < 1 or page > last_page:
+        return None
+    if page == 1:
+        return remove_query_param(url, 'page')
+    return replace_query_param(url, 'page', page)
+
+
+async def paginate(request, queryset):
+    """Ответ в формате PageNumberPagination."""
+    page_size = api_settings.PAGE_SIZE
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404
+    count = await acount(queryset)
+    last_page = max(1, -(-count // page_size))
+    if page < 1 or page > last_page:
+        raise Http404
+    offset = (page - 1) * page_size
+    results = await alist(queryset[offset:offset + page_size])
+    return {
+        'count': count,
+        'next': page_link(request, page + 1, last_page),
+        'previous': page_link(request, page - 1, last_page),
+        'results': results,
+    }
+
+
+# api/v1/async/posts/
+@read_view
+async def post_list(request):
+    queryset = annotate_post_list(Post.objects.order_by('-created_at'), request.user)
+    category = request.GET.get('category')
+    if category:
+        queryset = queryset.filter(category=category)
+    data = await paginate(request, queryset)
+    data['results'] = PostListReadSerializer(data['results'], many=True, context={'request': request}).data
+    return render(data)
+
+
+# api/v1/async/posts/id/
+@read_view
+async def post_detail(request, pk):
+    try:
+        post = await aget(Post.objects.select_related('user'), pk=pk)
+    except (Post.DoesNotExist, ValueError):
+        raise Http404
+    # картинки, видео и отзывы сериализатор достаёт сам - читаем их за один переход
+    data = await sync_to_async(lambda: PostReadSerializer(post, context={'request': request}).data)()
+    return render(data)
+
+
+# api/v1/async/posts/id/reviews/
+@read_view
+async def post_reviews(request, pk):
+    try:
+        post = await aget(Post.objects.only('id'), pk=pk)
+    except (Post.DoesNotExist, ValueError):
+        raise Http404
+    return render(await sync_to_async(review_rows)(post.reviews.all()))
+
+
+# api/v1/async/categories/
+@read_view
+async def category_list(request):
+    data = await paginate(request, Category.objects.order_by('slug'))
+    data['results'] = CategorySerializer(data['results'], many=True).data
+    return render(data)
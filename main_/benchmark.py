@@ -0,0 +1,226 @@
+"""Нагрузочный прогон API: синтетические данные, задержки, число запросов и память по эндпоинтам.
+
+Запускается командой run_benchmarks на отдельной тестовой базе; бюджеты лежат
+в main_/benchmark_budgets.json.
+"""
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from main_.models import Category, Post, PostImage, Review, Like, Favorite, SearchToken
+from main_.search import build_tokens
+from main_.serializers import PostListSerializer, PostSerializer, PostListReadSerializer, PostReadSerializer
+from main_.views import annotate_post_list
+
+User = get_user_model()
+
+WORDS = ['титан', 'астрал', 'клоун', 'дом', 'ночь', 'город', 'война', 'любовь', 'тайна', 'море',
+         'призрак', 'остров', 'поезд', 'зеркало', 'лес', 'сон', 'охота', 'огонь', 'тень', 'код']
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+def seed(users=50, posts=500, images=1, reviews=3, likes=20, random_seed=0):
+    """Заполняет базу синтетическим каталогом пачками, как import_catalogue."""
+    rng = random.Random(random_seed)
+    password = User(email='seed@bench.local')
+    password.set_password('benchmark')
+    User.objects.bulk_create([
+        User(email=f'user{i}@bench.local', name=f'User {i}', is_active=True, password=password.password)
+        for i in range(users)
+    ])
+    emails = [f'user{i}@bench.local' for i in range(users)]
+    categories = Category.objects.bulk_create([
+        Category(slug=slug, name=slug.capitalize()) for slug in ('horror', 'drama', 'comedy', 'anime')
+    ])
+    created = Post.objects.bulk_create([
+        Post(title=sentence(rng, 3), text=sentence(rng, 40), user_id=rng.choice(emails),
+             category=rng.choice(categories))
+        for _ in range(posts)
+    ], batch_size=1000)
+    SearchToken.objects.bulk_create([
+        SearchToken(post=post, token=token, weight=weight)
+        for post in created for token, weight in build_tokens(post.title, post.text).items()
+    ], batch_size=1000)
+    PostImage.objects.bulk_create([
+        PostImage(post=post, image=f'posts/bench{i}.jpg') for post in created for i in range(images)
+    ], batch_size=1000)
+    Review.objects.bulk_create([
+        Review(post=post, user_id=rng.choice(emails), text=sentence(rng, 10), rating=rng.randint(1, 5))
+        for post in created for _ in range(reviews)
+    ], batch_size=1000)
+    for model in (Like, Favorite):
+        model.objects.bulk_create([
+            model(user_id=email, post=post)
+            for email in emails for post in rng.sample(created, min(likes, len(created)))
+        ], batch_size=1000, ignore_conflicts=True)
+    call_command('rebuild_post_counters', stdout=StringIO())
+    return created
+
+
+def scenarios(posts):
+    """[(имя, метод, функция(номер итерации) -> (путь, данные))]."""
+    post_id = posts[len(posts) // 2].pk
+    return [
+        ('posts-list', 'get', lambda i: ('/api/v1/posts/', None)),
+        ('posts-list-ordered', 'get', lambda i: ('/api/v1/posts/?ordering=-rating_average', None)),
+        ('posts-detail', 'get', lambda i: (f'/api/v1/posts/{posts[i % len(posts)].pk}/', None)),
+        ('posts-search', 'get', lambda i: (f'/api/v1/posts/search/?q={WORDS[i % len(WORDS)]}', None)),
+        ('posts-reviews', 'get', lambda i: (f'/api/v1/posts/{post_id}/reviews/', None)),
+        # чётные итерации ставят лайк, нечётные снимают
+        ('posts-like-toggle', 'post',
+         lambda i: (f'/api/v1/posts/{post_id}/{"like" if i % 2 == 0 else "dislike"}/', None)),
+        ('posts-favorite-toggle', 'post',
+         lambda i: (f'/api/v1/posts/{post_id}/{"add_to_favorites" if i % 2 == 0 else "remove_from_favorites"}/',
+                    None)),
+        ('account-register', 'post', lambda i: ('/api/v1/register/', {
+            'email': f'new{i}-{time.monotonic_ns()}@bench.local', 'name': 'New', 'password': '12345678',
+            'password_confirmation': '12345678',
+        })),
+    ]
+
+
+def percentile(values, point):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(point / 100 * (len(ordered) - 1))))]
+
+
+def measure(client, method, make_request, iterations):
+    def request(path, data, **kwargs):
+        response = getattr(client, method)(path, data, **kwargs)
+        if response.streaming:
+            # потоковый ответ читает из базы только при итерации
+            b''.join(response.streaming_content)
+        return response
+
+    # прогрев: первые запросы платят за импорты и пустые кеши
+    path, data = make_request(0)
+    request(path, data, format='json')
+
+    latencies, status = [], None
+    for i in range(1, iterations + 1):
+        path, data = make_request(i)
+        started = time.perf_counter()
+        response = request(path, data, format='json')
+        latencies.append((time.perf_counter() - started) * 1000)
+        status = response.status_code
+
+    # память и запросы - отдельным проходом, tracemalloc сам замедляет код
+    path, data = make_request(iterations + 1)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            request(path, data, format='json')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': status,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(posts, iterations=50, only=None):
+    user = User.objects.filter(is_active=True).order_by('pk').first()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+    results = {}
+    for name, method, make_request in scenarios(posts):
+        if only and name not in only:
+            continue
+        results[name] = measure(client, method, make_request, iterations)
+    return results
+
+
+def check_budgets(results, budgets):
+    """Список превышений вида 'posts-list: queries 6 > 4'."""
+    failures = []
+    for name, result in results.items():
+        if result['status'] >= 400:
+            failures.append(f'{name}: ответ {result["status"]}')
+        for metric, limit in budgets.get(name, {}).items():
+            if result[metric] > limit:
+                failures.append(f'{name}: {metric} {result[metric]} > {limit}')
+    return failures
+
+
+def load_budgets(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def serializer_throughput(rows=200, repeat=5):
+    """Строк в секунду у ModelSerializer и быстрых сериализаторов на одних и тех же постах.
+
+    Детальная страница читает картинки, видео и отзывы сама, поэтому в её цифры входят запросы к БД.
+    """
+    request = RequestFactory().get('/api/v1/posts/')
+    request.user = User.objects.filter(is_active=True).order_by('pk').first()
+    context = {'request': request}
+    posts = list(annotate_post_list(Post.objects.order_by('-created_at'), request.user)[:rows])
+    details = list(Post.objects.order_by('-created_at')[:rows])
+    results = {}
+    for name, serializer_class, objects in [
+        ('post-list', PostListSerializer, posts),
+        ('post-list-read', PostListReadSerializer, posts),
+        ('post-detail', PostSerializer, details),
+        ('post-detail-read', PostReadSerializer, details),
+    ]:
+        serializer_class(objects[:1], many=True, context=context).data
+        started = time.perf_counter()
+        for _ in range(repeat):
+            serializer_class(objects, many=True, context=context).data
+        results[name] = round(len(objects) * repeat / (time.perf_counter() - started))
+    return results
+
+
+def async_throughput(posts, requests=200, concurrency=20):
+    """Запросов в секунду у DRF-вьюх и у main_.async_views при concurrency одновременных запросах.
+
+    Оба варианта идут через AsyncClient, то есть через ASGI-обработчик в одном процессе,
+    без сети и uvicorn: DRF-вьюха уходит в поток целиком, async-вьюха - на каждый запрос к БД.
+    """
+    user = User.objects.filter(is_active=True).order_by('pk').first()
+    headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.get_or_create(user=user)[0].key}'}
+    post_id = posts[len(posts) // 2].pk
+    pairs = [
+        ('posts-list', '/api/v1/posts/', '/api/v1/async/posts/'),
+        ('posts-detail', f'/api/v1/posts/{post_id}/', f'/api/v1/async/posts/{post_id}/'),
+        ('posts-reviews', f'/api/v1/posts/{post_id}/reviews/', f'/api/v1/async/posts/{post_id}/reviews/'),
+        ('categories', '/api/v1/categories/', '/api/v1/async/categories/'),
+    ]
+
+    async def measure_path(path):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with semaphore:
+                response = await client.get(path, **headers)
+                assert response.status_code == 200, (path, response.status_code)
+
+        await request()
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(requests)))
+        return round(requests / (time.perf_counter() - started))
+
+    # async_to_sync, а не asyncio.run: тогда sync_to_async работает в этом потоке и с его соединением к БД
+    measure_sync = async_to_sync(measure_path)
+    return {name: (measure_sync(sync_path), measure_sync(async_path)) for name, sync_path, async_path in pairs}
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework.response import Response
+
+from main_.models import Like, Favorite
+
+USER_FLAGS = ['is_liked', 'is_favorited']
+# кеш - только ускорение: если Redis недоступен, отвечаем без кеша, а не 500
+CACHE_ERRORS = (RedisError, OSError)
+
+logger = logging.getLogger(__name__)
+
+
+def versions(*names):
+    """Текущие версии данных или None, если кеш недоступен."""
+    # версия меняется при любом изменении данных, старые ключи просто истекают
+    names = [f'api:version:{name}' for name in names]
+    try:
+        current = cache.get_many(names)
+        for name in names:
+            if name not in current:
+                current[name] = uuid.uuid4().hex
+                cache.add(name, current[name], None)
+    except CACHE_ERRORS:
+        logger.exception('Кеш недоступен, версии %s не прочитаны', names)
+        return None
+    return [current[name] for name in names]
+
+
+def invalidate(*names):
+    def bump():
+        try:
+            cache.set_many({f'api:version:{name}': uuid.uuid4().hex for name in names}, None)
+        except CACHE_ERRORS:
+            # запись в БД уже закоммичена, ответ из-за кеша не роняем
+            logger.exception('Кеш недоступен, версии %s не обновлены', names)
+    # после коммита, чтобы параллельный запрос не закешировал старые данные
+    transaction.on_commit(bump)
+
+
+def invalidate_post(post_id):
+    invalidate_posts([post_id])
+
+
+def invalidate_posts(post_ids):
+    invalidate('posts', *[f'post:{post_id}' for post_id in post_ids])
+
+
+def response_key(request, *names):
+    current = versions(*names)
+    if current is None:
+        return None
+    query = '&'.join(f'{key}={value}' for key, value in sorted(request.query_params.items()))
+    raw = ':'.join([request.path, query, *current])
+    return 'api:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def items(data):
+    if isinstance(data, dict) and 'results' in data:
+        return data['results']
+    if isinstance(data, dict):
+        return [data]
+    return data
+
+
+def add_user_flags(data, user):
+    posts = items(data)
+    ids = [post['id'] for post in posts]
+    liked = set(Like.objects.filter(user=user, post_id__in=ids).values_list('post_id', flat=True))
+    favorited = set(Favorite.objects.filter(user=user, post_id__in=ids).values_list('post_id', flat=True))
+    for post in posts:
+        post['is_favorited'] = post['id'] in favorited
+        post['is_liked'] = post['id'] in liked
+    return data
+
+
+def strip_user_flags(data):
+    if isinstance(data, dict) and 'results' in data:
+        return {**data, 'results': [strip_user_flags(post) for post in data['results']]}
+    if isinstance(data, dict):
+        return {key: value for key, value in data.items() if key not in USER_FLAGS}
+    return [strip_user_flags(post) for post in data]
+
+
+def cached_response(request, names, get_response, user_flags=False):
+    """Отдаёт общий для всех ответ из кеша, персональные флаги добавляются сверху."""
+    timeout = settings.API_CACHE_TIMEOUT
+    if not timeout:
+        return get_response()
+    key = response_key(request, *names)
+    if key is None:
+        return get_response()
+    try:
+        data = cache.get(key)
+    except CACHE_ERRORS:
+        logger.exception('Кеш недоступен, ответ собирается без него')
+        return get_response()
+    if data is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+        data = response.data
+        if user_flags and request.user.is_authenticated:
+            data = strip_user_flags(data)
+        try:
+            cache.set(key, data, timeout)
+        except CACHE_ERRORS:
+            logger.exception('Кеш недоступен, ответ не сохранён')
+        return response
+    if user_flags and request.user.is_authenticated:
+        add_user_flags(data, request.user)
+    return Response(data)
@@ -0,0 +1,176 @@
+"""Импорт и экспорт каталога в JSONL: одна строка - один пост с картинками, трейлерами и отзывами.
+
+{"title": ..., "text": ..., "category": "horror", "user": "author@gmail.com",
+ "images": ["posts/aot.jpg"], "videos": ["posts/aot.mp4"],
+ "reviews": [{"user": "user@gmail.com", "text": ..., "rating": 5}]}
+
+Пути медиа при импорте берутся относительно --media-root источника.
+"""
+import json
+import os
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Prefetch
+
+from main_.models import Category, Post, PostImage, PostVideo, Review, SearchToken, VideoTranscode
+from main_.search import build_tokens
+from main_.tasks import process_post_image, send_new_series, transcode_video
+
+User = get_user_model()
+
+
+class LineError(ValueError):
+    pass
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_line(line, categories):
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise LineError(f'некорректный JSON: {error}')
+    if not isinstance(data, dict):
+        raise LineError('ожидается объект')
+    missing = [field for field in ('title', 'text', 'category') if not data.get(field)]
+    if missing:
+        raise LineError('нет полей ' + ', '.join(missing))
+    if data['category'] not in categories:
+        raise LineError(f'неизвестная категория {data["category"]}')
+    for review in data.get('reviews', []):
+        if not isinstance(review, dict) or not review.get('user'):
+            raise LineError('у отзыва нет пользователя')
+        if not isinstance(review.get('rating'), int) or not 1 <= review['rating'] <= 5:
+            raise LineError('оценка отзыва должна быть от 1 до 5')
+    return data
+
+
+def source_path(source_root, name):
+    """Путь к файлу внутри source_root или None, если name ведёт наружу (../, абсолютный путь, симлинк)."""
+    root = os.path.realpath(source_root)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
+def copy_media(path, name, field):
+    # storage сам подберёт свободное имя, если такой файл уже есть
+    with open(path, 'rb') as file:
+        return field.storage.save(field.generate_filename(None, os.path.basename(name)), File(file))
+
+
+class Importer:
+    def __init__(self, pool, media_root=None, author=None, notify=True):
+        self.pool = pool
+        self.media_root = media_root
+        self.author = author
+        self.notify = notify
+        # слаги категорий читаем один раз на весь импорт
+        self.categories = set(Category.objects.values_list('slug', flat=True))
+        self.warnings = []
+
+    def copy_all(self, rows, key, field):
+        """{(номер строки, путь): новое имя} - копии делаются параллельно в пуле потоков."""
+        jobs = {}
+        for number, data in rows:
+            for name in data.get(key, []):
+                path = source_path(self.media_root, name) if self.media_root else None
+                if self.media_root and path is None:
+                    self.warnings.append(f'Строка {number}: путь {name} вне --media-root')
+                elif path and os.path.isfile(path):
+                    jobs[number, name] = self.pool.submit(copy_media, path, name, field)
+                else:
+                    self.warnings.append(f'Строка {number}: файл {name} не найден')
+        return {job: future.result() for job, future in jobs.items()}
+
+    def import_batch(self, rows):
+        """rows - [(номер строки, данные)], возвращает созданные посты."""
+        emails = {data['user'] for _, data in rows if data.get('user')}
+        emails.update(review['user'] for _, data in rows for review in data.get('reviews', []))
+        users = User.objects.in_bulk(emails)
+
+        posts, reviews = [], []
+        for number, data in rows:
+            author = users.get(data.get('user')) or self.author
+            if author is None:
+                self.warnings.append(f'Строка {number}: нет автора {data.get("user")}')
+                continue
+            ratings = [review for review in data.get('reviews', []) if review['user'] in users]
+            if len(ratings) != len(data.get('reviews', [])):
+                self.warnings.append(f'Строка {number}: отзывы неизвестных пользователей пропущены')
+            # bulk_create не вызывает update_counters, счётчики отзывов заполняем сразу
+            rating_sum = sum(review['rating'] for review in ratings)
+            post = Post(title=data['title'], text=data['text'], category_id=data['category'], user=author,
+                        reviews_count=len(ratings), rating_sum=rating_sum,
+                        rating_average=rating_sum / len(ratings) if ratings else 0)
+            posts.append((number, data, post))
+            reviews.append(ratings)
+
+        rows = [(number, data) for number, data, _ in posts]
+        images = self.copy_all(rows, 'images', PostImage._meta.get_field('image'))
+        videos = self.copy_all(rows, 'videos', PostVideo._meta.get_field('video'))
+
+        with transaction.atomic():
+            Post.objects.bulk_create([post for _, _, post in posts])
+            # сигналы post_save не шлются: индекс поиска, медиа и отзывы пишем сами
+            SearchToken.objects.bulk_create([
+                SearchToken(post=post, token=token, weight=weight)
+                for _, _, post in posts for token, weight in build_tokens(post.title, post.text).items()
+            ])
+            Review.objects.bulk_create([
+                Review(post=post, user=users[review['user']], text=review.get('text', ''), rating=review['rating'])
+                for (_, _, post), ratings in zip(posts, reviews) for review in ratings
+            ])
+            new_images = PostImage.objects.bulk_create([
+                PostImage(post=post, image=images[number, name])
+                for number, data, post in posts for name in data.get('images', []) if (number, name) in images
+            ])
+            new_videos = PostVideo.objects.bulk_create([
+                PostVideo(post=post, video=videos[number, name])
+                for number, data, post in posts for name in data.get('videos', []) if (number, name) in videos
+            ])
+            VideoTranscode.objects.bulk_create([VideoTranscode(video=video) for video in new_videos])
+            transaction.on_commit(lambda: self.schedule(posts, new_images, new_videos))
+        return [post for _, _, post in posts]
+
+    def schedule(self, posts, images, videos):
+        for image in images:
+            process_post_image.delay(image.pk)
+        for video in videos:
+            transcode_video.delay(video.pk)
+        if self.notify:
+            for _, _, post in posts:
+                send_new_series.delay(post.pk)
+
+
+def export_posts(batch_size):
+    """Посты каталога словарями для JSONL, в памяти одна пачка."""
+    queryset = Post.objects.prefetch_related(
+        'pics', 'trailer', Prefetch('reviews', queryset=Review.objects.order_by('id'))
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        # iterator() в Django 4.0 не умеет prefetch_related, поэтому пачками по pk
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        for post in batch:
+            yield {
+                'title': post.title,
+                'text': post.text,
+                'category': post.category_id,
+                'user': post.user_id,
+                'images': [image.image.name for image in post.pics.all()],
+                'videos': [video.video.name for video in post.trailer.all()],
+                'reviews': [{'user': review.user_id, 'text': review.text, 'rating': review.rating}
+                            for review in post.reviews.all()],
+            }
+        last_pk = batch[-1].pk
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from main_.cache import versions
+from main_.models import Category, Post
+
+
+def user_variant(request):
+    # is_liked / is_favorited зависят от пользователя
+    return str(request.user.pk) if request.user.is_authenticated else 'anon'
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def post_updated_at(request, pk):
+    # etag и last_modified считаются из одного запроса, результат кладём в request
+    if not hasattr(request, '_post_updated_at'):
+        request._post_updated_at = Post.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return request._post_updated_at
+
+
+def post_etag(request, pk=None, *args, **kwargs):
+    updated_at = post_updated_at(request, pk)
+    if updated_at is None:
+        return None
+    return make_etag(request.path, pk, updated_at.timestamp(), user_variant(request))
+
+
+def post_last_modified(request, pk=None, *args, **kwargs):
+    return post_updated_at(request, pk)
+
+
+def post_stats_etag(request, pk=None, *args, **kwargs):
+    # в ответе есть перцентили категории, они меняются без записи в сам пост
+    updated_at = post_updated_at(request, pk)
+    current = versions('categories')
+    if updated_at is None or current is None:
+        return None
+    return make_etag(request.path, pk, updated_at.timestamp(), *current)
+
+
+def posts_etag(request, *args, **kwargs):
+    # версия 'posts' из main_.cache меняется при любом изменении постов и связанных
+    # с ними объектов, так что ETag списка считается без запроса к БД
+    current = versions('posts')
+    if current is None:
+        # без кеша версии нет - отдаём ответ без ETag
+        return None
+    return make_etag(request.get_full_path(), *current, user_variant(request))
+
+
+def categories_etag(request, *args, **kwargs):
+    categories = Category.objects.order_by('slug').values_list('slug', 'name')
+    return make_etag(request.get_full_path(), *categories)
+
+
+post_conditional = method_decorator(condition(etag_func=post_etag, last_modified_func=post_last_modified))
+post_stats_conditional = method_decorator(condition(etag_func=post_stats_etag))
+posts_conditional = method_decorator(condition(etag_func=posts_etag))
+categories_conditional = method_decorator(condition(etag_func=categories_etag))
@@ -0,0 +1,64 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, features
+
+# формат Pillow -> расширение файла
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def supported(image_format):
+    try:
+        return features.check_module(image_format)
+    except ValueError:
+        # jpeg не отдельный модуль Pillow, avif нет в старых версиях
+        return image_format == 'jpeg'
+
+
+def build_variants(file_field):
+    """Сохраняет уменьшенные копии картинки и возвращает их описание для PostImage.variants."""
+    storage = file_field.storage
+    with file_field.open('rb') as file:
+        content = file.read()
+    digest = hashlib.sha1(content).hexdigest()[:16]
+    original = Image.open(BytesIO(content))
+    original.load()
+    if original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+
+    # не увеличиваем: ширины больше оригинала заменяются самим оригиналом
+    widths = sorted({min(width, original.width) for width in settings.IMAGE_VARIANT_WIDTHS})
+    variants = []
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.LANCZOS)
+        for image_format in settings.IMAGE_VARIANT_FORMATS:
+            if not supported(image_format):
+                continue
+            name = f'posts/variants/{digest}_{width}.{EXTENSIONS[image_format]}'
+            if not storage.exists(name):
+                buffer = BytesIO()
+                resized.save(buffer, image_format.upper(), quality=settings.IMAGE_VARIANT_QUALITY)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants.append({'format': image_format, 'width': width, 'name': name})
+    return variants
+
+
+def srcset(variants, storage):
+    """{'webp': 'url 200w, url 400w', ...} для <picture><source srcset>."""
+    result = {}
+    for variant in variants:
+        entry = f'{storage.url(variant["name"])} {variant["width"]}w'
+        result[variant['format']] = f'{result[variant["format"]]}, {entry}' if variant['format'] in result else entry
+    return result
+
+
+def thumbnail(variants, storage):
+    # самый маленький вариант в самом лёгком из доступных форматов
+    for image_format in settings.IMAGE_VARIANT_FORMATS:
+        candidates = [variant for variant in variants if variant['format'] == image_format]
+        if candidates:
+            return storage.url(min(candidates, key=lambda variant: variant['width'])['name'])
+    return ''
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db.models import F
+
+from main_.models import Post
+
+
+def limit_from(request):
+    try:
+        limit = int(request.query_params.get('limit', settings.LEADERBOARD_SIZE))
+    except ValueError:
+        limit = settings.LEADERBOARD_SIZE
+    return max(1, min(limit, settings.LEADERBOARD_MAX_SIZE))
+
+
+def trending(queryset, limit):
+    # верхние k записей индекса post_trending_idx
+    return queryset.filter(trending_score__gt=0).order_by('-trending_score', '-id')[:limit]
+
+
+def top_rated(queryset, category, limit):
+    # индекс post_category_bayes_idx; постам с парой отзывов в топе не место
+    return queryset.filter(category=category, reviews_count__gte=settings.TOP_RATED_MIN_REVIEWS) \
+        .order_by('-bayesian_average', '-id')[:limit]
+
+
+def decay_trending():
+    """Умножает все ненулевые trending_score на коэффициент затухания за один интервал."""
+    factor = 0.5 ** (settings.TRENDING_DECAY_INTERVAL / settings.TRENDING_HALF_LIFE)
+    # хвост обнуляем, чтобы следующий проход не трогал старые посты
+    Post.objects.filter(trending_score__gt=0, trending_score__lt=settings.TRENDING_MIN_SCORE).update(trending_score=0)
+    return Post.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from main_.catalogue import export_posts
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты с картинками, трейлерами и отзывами в JSONL (см. main_.catalogue)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL, "-" - stdout')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        to_stdout = options['path'] == '-'
+        file = self.stdout if to_stdout else open(options['path'], 'w', encoding='utf-8')
+        count = 0
+        try:
+            for post in export_posts(options['batch_size']):
+                file.write(json.dumps(post, ensure_ascii=False) + '\n')
+                count += 1
+        finally:
+            if not to_stdout:
+                file.close()
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(f'Выгружено постов: {count}'))
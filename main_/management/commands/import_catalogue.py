@@ -0,0 +1,63 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main_.cache import invalidate
+from main_.catalogue import Importer, LineError, batches, parse_line
+from main_.tasks import send_catalogue_digest
+
+
+class Command(BaseCommand):
+    help = 'Импортирует посты с картинками, трейлерами и отзывами из JSONL (см. main_.catalogue)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL, "-" - stdin')
+        parser.add_argument('--media-root', help='Каталог, относительно которого указаны пути медиа')
+        parser.add_argument('--user', help='Автор постов, у которых нет своего или он не найден')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=8, help='Потоков для копирования медиа')
+        parser.add_argument('--digest', action='store_true',
+                            help='Не слать письмо на каждый фильм, а в конце одно письмо со списком')
+
+    def handle(self, *args, **options):
+        author = None
+        if options['user']:
+            author = get_user_model().objects.filter(pk=options['user']).first()
+            if author is None:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        file = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        created, skipped = [], 0
+        try:
+            with ThreadPoolExecutor(options['workers']) as pool:
+                importer = Importer(pool, media_root=options['media_root'], author=author,
+                                    notify=not options['digest'])
+                for batch in batches(self.parse(file, importer), options['batch_size']):
+                    posts = importer.import_batch([row for row in batch if row is not None])
+                    skipped += len(batch) - len(posts)
+                    created.extend(post.pk for post in posts)
+                    self.stdout.write(f'Импортировано постов: {len(created)}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        for warning in importer.warnings:
+            self.stderr.write(warning)
+        invalidate('posts', 'categories')
+        if options['digest'] and created:
+            transaction.on_commit(lambda: send_catalogue_digest.delay(created))
+        self.stdout.write(self.style.SUCCESS(f'Создано постов: {len(created)}, пропущено строк: {skipped}'))
+
+    def parse(self, file, importer):
+        # None вместо ошибочной строки, чтобы посчитать её в пропущенных
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, parse_line(line, importer.categories)
+            except LineError as error:
+                self.stderr.write(f'Строка {number}: {error}')
+                yield None
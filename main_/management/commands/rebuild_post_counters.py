@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main_.cache import invalidate_posts
+from main_.models import Post, Like, Favorite, Review
+
+COUNTERS = ['likes_count', 'favorites_count', 'reviews_count', 'rating_sum']
+
+
+def aggregate(model, function):
+    return Coalesce(Subquery(
+        model.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        .annotate(value=function).values('value')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики лайков, избранного и отзывов у постов и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать расхождения, ничего не записывать')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.only('id', 'rating_average', *COUNTERS).annotate(
+            actual_likes_count=aggregate(Like, Count('id')),
+            actual_favorites_count=aggregate(Favorite, Count('id')),
+            actual_reviews_count=aggregate(Review, Count('id')),
+            actual_rating_sum=aggregate(Review, Sum('rating')),
+        ).order_by('id')
+
+        drifted = []
+        for post in queryset.iterator(chunk_size=options['batch_size']):
+            changes = []
+            for field in COUNTERS:
+                stored, actual = getattr(post, field), getattr(post, f'actual_{field}')
+                if stored != actual:
+                    changes.append(f'{field}: {stored} -> {actual}')
+                    setattr(post, field, actual)
+            rating_average = post.rating_sum / post.reviews_count if post.reviews_count else 0
+            if abs(post.rating_average - rating_average) > 1e-9:
+                changes.append(f'rating_average: {post.rating_average} -> {rating_average}')
+                post.rating_average = rating_average
+            if changes:
+                self.stdout.write(f'Пост {post.pk}: ' + ', '.join(changes))
+                drifted.append(post)
+
+        if drifted and not options['dry_run']:
+            # bulk_update не трогает auto_now, а по updated_at считается ETag детальной страницы
+            now = timezone.now()
+            for post in drifted:
+                post.updated_at = now
+            with transaction.atomic():
+                Post.objects.bulk_update(drifted, [*COUNTERS, 'rating_average', 'updated_at'],
+                                         batch_size=options['batch_size'])
+                # одна смена версий после коммита: 'posts' и ключи только изменившихся постов
+                invalidate_posts([post.pk for post in drifted])
+        self.stdout.write(self.style.SUCCESS(f'Постов с расхождениями: {len(drifted)}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main_.recommendations import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие посты по лайкам и избранному'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все посты, а не только изменившиеся с прошлого запуска')
+
+    def handle(self, *args, **options):
+        count = rebuild(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано постов: {count}'))
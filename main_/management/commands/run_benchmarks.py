@@ -0,0 +1,90 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from blog.celery import celery_app
+from main_ import benchmark
+
+BUDGETS_PATH = os.path.join(os.path.dirname(benchmark.__file__), 'benchmark_budgets.json')
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет основные эндпоинты API на синтетических данных и сверяет результаты с бюджетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--images', type=int, default=1, help='Картинок на пост')
+        parser.add_argument('--reviews', type=int, default=3, help='Отзывов на пост')
+        parser.add_argument('--likes', type=int, default=20, help='Лайков и избранного на пользователя')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--only', nargs='+', help='Имена сценариев, например posts-list posts-search')
+        parser.add_argument('--cache', action='store_true', help='Мерить с кешем ответов API')
+        parser.add_argument('--serializers', action='store_true',
+                            help='Только сравнить скорость сериализаторов постов, строк/с')
+        parser.add_argument('--async', dest='async_views', action='store_true',
+                            help='Только сравнить DRF-вьюхи с async-вьюхами под ASGI, запросов/с')
+        parser.add_argument('--output', help='Куда записать результаты в JSON')
+        parser.add_argument('--budgets', default=BUDGETS_PATH)
+        parser.add_argument('--update-budgets', action='store_true',
+                            help='Записать текущие результаты как новые бюджеты (с запасом по времени и памяти)')
+
+    def handle(self, *args, **options):
+        # отдельная тестовая база, рабочие данные не трогаем
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                API_CACHE_TIMEOUT=300 if options['cache'] else 0,
+            ):
+                posts = benchmark.seed(users=options['users'], posts=options['posts'], images=options['images'],
+                                       reviews=options['reviews'], likes=options['likes'])
+                if options['serializers']:
+                    throughput = benchmark.serializer_throughput()
+                elif options['async_views']:
+                    throughput = benchmark.async_throughput(posts)
+                else:
+                    results = benchmark.run(posts, iterations=options['iterations'], only=options['only'])
+        finally:
+            celery_app.conf.task_always_eager = eager
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['serializers']:
+            for name, rows in throughput.items():
+                self.stdout.write(f'{name:24} {rows:8} строк/с')
+            return
+        if options['async_views']:
+            for name, (sync_rps, async_rps) in throughput.items():
+                self.stdout.write(f'{name:24} DRF {sync_rps:6} запросов/с  async {async_rps:6} запросов/с')
+            return
+
+        for name, result in results.items():
+            self.stdout.write(f'{name:24} {result["status"]}  p50 {result["p50_ms"]:8.2f} мс  '
+                              f'p95 {result["p95_ms"]:8.2f} мс  запросов {result["queries"]:3}  '
+                              f'память {result["peak_kb"]:8.1f} КБ')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+        if options['update_budgets']:
+            budgets = {name: {'queries': result['queries'],
+                              'p95_ms': round(result['p95_ms'] * 3, 1),
+                              'peak_kb': round(result['peak_kb'] * 2, 1)}
+                       for name, result in results.items()}
+            with open(options['budgets'], 'w', encoding='utf-8') as file:
+                json.dump(budgets, file, indent=2)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Бюджеты записаны в {options["budgets"]}'))
+            return
+
+        failures = benchmark.check_budgets(results, benchmark.load_budgets(options['budgets']))
+        if failures:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все эндпоинты в пределах бюджетов'))
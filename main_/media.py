@@ -0,0 +1,118 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from main_.models import PostImage, PostVideo
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Отдаёт length байт файла, начиная со start.
+
+    fileno() и tell() оставлены, чтобы wsgi.file_wrapper (gunicorn) мог отправить
+    диапазон через os.sendfile без чтения в Python.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, length) для одного диапазона, None - отдать файл целиком, ValueError - 416."""
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        # несколько диапазонов и мусор игнорируем, как разрешает RFC 7233
+        return None
+    first, last = match.groups()
+    if not first:
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, end - start + 1
+
+
+def is_published(name):
+    # отдаём только файлы, привязанные к постам
+    if name.startswith(('posts/variants/', 'posts/hls/')):
+        return True
+    return PostVideo.objects.filter(video=name).exists() or PostImage.objects.filter(image=name).exists()
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path) or not is_published(path):
+        raise Http404
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if settings.MEDIA_SERVE_MODE == 'x-accel-redirect':
+        # nginx сам отдаст файл из internal-локейшена, включая Range
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+        return response
+    if settings.MEDIA_SERVE_MODE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+    last_modified = http_date(stat.st_mtime)
+    byte_range = None
+    if request.headers.get('If-Range', last_modified) == last_modified:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(RangeFile(file, start, length), status=206, content_type=content_type,
+                                filename=os.path.basename(full_path))
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    return response
@@ -0,0 +1,56 @@
+# Generated by Django 4.0 on 2026-10-17 17:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('main_', 'Post')
+    Like = apps.get_model('main_', 'Like')
+    Favorite = apps.get_model('main_', 'Favorite')
+    Review = apps.get_model('main_', 'Review')
+
+    def aggregate(model, function):
+        return Coalesce(Subquery(
+            model.objects.filter(post=OuterRef('pk')).order_by().values('post')
+            .annotate(value=function).values('value')
+        ), 0)
+
+    Post.objects.update(
+        likes_count=aggregate(Like, Count('id')),
+        favorites_count=aggregate(Favorite, Count('id')),
+        reviews_count=aggregate(Review, Count('id')),
+        rating_sum=aggregate(Review, Sum('rating')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0005_favorite_like_delete_favorites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='favorites_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reviews_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.0 on 2026-10-17 17:23
+
+from django.db import migrations, models
+from django.db.models import Case, F, FloatField, When
+from django.db.models.functions import Cast
+
+
+def fill_rating_average(apps, schema_editor):
+    Post = apps.get_model('main_', 'Post')
+    Post.objects.update(rating_average=Case(
+        When(reviews_count=0, then=0.0),
+        default=Cast('rating_sum', FloatField()) / F('reviews_count'),
+        output_field=FloatField()
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0006_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(fill_rating_average, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-rating_average', '-id'], name='post_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-likes_count', '-id'], name='post_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', '-created_at'], name='post_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['title'], name='post_title_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0 on 2026-10-17 17:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+from collections import Counter
+
+
+def index_posts(apps, schema_editor):
+    Post = apps.get_model('main_', 'Post')
+    SearchToken = apps.get_model('main_', 'SearchToken')
+    for post in Post.objects.only('id', 'title', 'text').iterator():
+        weights = Counter()
+        for token in re.findall(r'\w+', post.title.lower()):
+            weights[token[:50]] += 3
+        for token in re.findall(r'\w+', post.text.lower()):
+            weights[token[:50]] += 1
+        SearchToken.objects.bulk_create([
+            SearchToken(post=post, token=token, weight=weight)
+            for token, weight in weights.items() if len(token) > 1
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0007_post_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='main_.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['token'], name='search_token_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchtoken',
+            unique_together={('token', 'post')},
+        ),
+        migrations.RunPython(index_posts, migrations.RunPython.noop),
+    ]
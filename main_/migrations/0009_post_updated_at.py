@@ -0,0 +1,29 @@
+# Generated by Django 4.0 on 2026-10-17 17:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Post = apps.get_model('main_', 'Post')
+    Post.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0008_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-updated_at'], name='post_updated_idx'),
+        ),
+    ]
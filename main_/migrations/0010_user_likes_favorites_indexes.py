@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-17 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0009_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-id'], name='favorite_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['user', '-id'], name='like_user_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0 on 2026-10-17 17:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+        ('main_', '0010_user_likes_favorites_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewSeriesNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='main_.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='account.user')),
+            ],
+            options={
+                'unique_together': {('post', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0011_newseriesnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0 on 2026-10-17 17:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0013_videoupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoTranscode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=20)),
+                ('manifest', models.CharField(blank=True, max_length=255)),
+                ('poster', models.CharField(blank=True, max_length=255)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('renditions', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transcode', to='main_.postvideo')),
+            ],
+        ),
+    ]
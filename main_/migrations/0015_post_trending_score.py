@@ -0,0 +1,34 @@
+# Generated by Django 4.0 on 2026-10-17 17:42
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_trending_score(apps, schema_editor):
+    # для старта берём накопленные счётчики с теми же весами, дальше они затухнут
+    Post = apps.get_model('main_', 'Post')
+    Post.objects.update(trending_score=F('likes_count') + 2 * F('favorites_count') + 3 * F('reviews_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0014_videotranscode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(fill_trending_score, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', '-rating_average', '-id'], name='post_category_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-17 17:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0015_post_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='main_.post')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main_.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='similarpost',
+            index=models.Index(fields=['post', '-score'], name='similar_post_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarpost',
+            unique_together={('post', 'similar')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0016_similarpost'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_category_rating_idx',
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='rating_percentiles',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='bayesian_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_percentile',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', '-bayesian_average', '-id'], name='post_category_bayes_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0 on 2026-10-17 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_', '0017_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postimage',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='posts'),
+        ),
+        migrations.AlterField(
+            model_name='postvideo',
+            name='video',
+            field=models.FileField(db_index=True, upload_to='posts'),
+        ),
+    ]
@@ -1,11 +1,20 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import F, Case, When, FloatField
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
 
 
 class Category(models.Model):
     name = models.CharField(max_length=50)
     slug = models.SlugField(primary_key=True)
+    # {'50': 3.9, ...} - перцентили bayesian_average постов категории, см. main_.rating_stats
+    rating_percentiles = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.name
@@ -20,28 +29,120 @@ class Post(models.Model):
         related_name='posts'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # меняется и при изменении отзывов, лайков и медиа (см. main_.signals)
+    updated_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(
         Category,
         on_delete=models.CASCADE,
         related_name='posts'
     )
+    # денормализованные счётчики, обновляются атомарно через update_counters
+    likes_count = models.IntegerField(default=0)
+    favorites_count = models.IntegerField(default=0)
+    reviews_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    # rating_sum / reviews_count, хранится для сортировки по индексу
+    rating_average = models.FloatField(default=0)
+    # считаются пачкой задачей rebuild_rating_stats, см. main_.rating_stats:
+    # число оценок 1..5, среднее с поправкой на малое число отзывов и место в категории
+    rating_histogram = models.JSONField(default=list, blank=True)
+    bayesian_average = models.FloatField(default=0)
+    rating_percentile = models.FloatField(null=True, blank=True)
+    # взвешенные лайки/избранное/отзывы, затухает задачей decay_trending_scores
+    trending_score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-rating_average', '-id'], name='post_rating_idx'),
+            models.Index(fields=['-likes_count', '-id'], name='post_likes_idx'),
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            models.Index(fields=['category', '-created_at'], name='post_category_created_idx'),
+            models.Index(fields=['title'], name='post_title_idx'),
+            models.Index(fields=['-updated_at'], name='post_updated_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+            models.Index(fields=['category', '-bayesian_average', '-id'], name='post_category_bayes_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    # вклад одного события в trending_score
+    TRENDING_WEIGHTS = {'likes_count': 1, 'favorites_count': 2, 'reviews_count': 3}
+
+    @staticmethod
+    def counter_updates(**deltas):
+        # UPDATE ... SET likes_count = likes_count + 1, без гонок между запросами
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        trend = sum(Post.TRENDING_WEIGHTS.get(field, 0) * delta for field, delta in deltas.items())
+        if trend:
+            # снятый лайк вычитаем, но не ниже нуля - вклад мог уже затухнуть
+            updates['trending_score'] = Greatest(F('trending_score') + trend, 0.0)
+        return updates
+
+    @staticmethod
+    def update_counters(post_id, **deltas):
+        posts = Post.objects.filter(pk=post_id)
+        posts.update(**Post.counter_updates(**deltas))
+        if 'rating_sum' in deltas or 'reviews_count' in deltas:
+            posts.update(rating_average=Post.rating_average_expression())
+
+    @staticmethod
+    def touch(post_id):
+        Post.objects.filter(pk=post_id).update(updated_at=timezone.now())
+
+    @staticmethod
+    def rating_average_expression():
+        return Case(
+            When(reviews_count=0, then=0.0),
+            default=Cast('rating_sum', FloatField()) / F('reviews_count'),
+            output_field=FloatField()
+        )
+
 
 class PostImage(models.Model):
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='pics')
-    image = models.ImageField(upload_to='posts')
+    # индекс - для проверки, опубликован ли файл, при отдаче медиа (main_.media)
+    image = models.ImageField(upload_to='posts', db_index=True)
+    # уменьшенные копии [{'format': 'webp', 'width': 200, 'name': ...}], см. main_.images
+    variants = models.JSONField(default=list, blank=True)
 
 
 class PostVideo(models.Model):
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='trailer')
-    video = models.FileField(upload_to='posts')
+    video = models.FileField(upload_to='posts', db_index=True)
+
+
+class VideoTranscode(models.Model):
+    # HLS-лесенка для трейлера, заполняется задачей main_.tasks.transcode_video
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    video = models.OneToOneField(PostVideo,
+                                 on_delete=models.CASCADE,
+                                 related_name='transcode')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    manifest = models.CharField(max_length=255, blank=True)
+    poster = models.CharField(max_length=255, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    # [{'height': 720, 'width': 1280, 'bitrate': 2800, 'playlist': ...}]
+    renditions = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.video_id} --- {self.status}'
 
 
 class Review(models.Model):
@@ -74,6 +175,7 @@ class Favorite(models.Model):
 
     class Meta:
         unique_together = ['post', 'user']
+        indexes = [models.Index(fields=['user', '-id'], name='favorite_user_idx')]
 
     def __str__(self):
         return f'{self.post}'
@@ -89,8 +191,88 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ['post', 'user']
+        indexes = [models.Index(fields=['user', '-id'], name='like_user_idx')]
 
     def __str__(self):
         return f'{self.post}'
 
 
+class SimilarPost(models.Model):
+    # top-k соседей поста по лайкам/избранному, пересчитывается задачей rebuild_recommendations
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='neighbours')
+    similar = models.ForeignKey(Post,
+                                on_delete=models.CASCADE,
+                                related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ['post', 'similar']
+        indexes = [models.Index(fields=['post', '-score'], name='similar_post_score_idx')]
+
+    def __str__(self):
+        return f'{self.post_id} --- {self.similar_id} --- {self.score:.3f}'
+
+
+class SearchToken(models.Model):
+    # инвертированный индекс для поиска: токен -> пост с весом
+    # (вхождения в заголовок весят больше, чем в описание)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='search_tokens')
+    token = models.CharField(max_length=50)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ['token', 'post']
+        indexes = [
+            # varchar_pattern_ops, чтобы token LIKE 'term%' шёл по индексу в PostgreSQL
+            models.Index(fields=['token'], name='search_token_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f'{self.token} --- {self.post_id}'
+
+
+class NewSeriesNotification(models.Model):
+    # отмечает отправленные письма о новом фильме, чтобы повтор чанка не слал дубли
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='notifications')
+    user = models.ForeignKey(get_user_model(),
+                             on_delete=models.CASCADE,
+                             related_name='notifications')
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['post', 'user']
+
+
+class VideoUpload(models.Model):
+    # загрузка трейлера по частям: части пишутся в файл в VIDEO_UPLOAD_TEMP_DIR,
+    # готовый файл становится PostVideo
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='video_uploads')
+    user = models.ForeignKey(get_user_model(),
+                             on_delete=models.CASCADE,
+                             related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    received = models.PositiveBigIntegerField(default=0)
+    video = models.OneToOneField(PostVideo,
+                                 on_delete=models.SET_NULL,
+                                 null=True,
+                                 blank=True,
+                                 related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.filename} --- {self.received}/{self.size}'
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.VIDEO_UPLOAD_TEMP_DIR, str(self.id))
@@ -0,0 +1,95 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class PostCursorPagination(CursorPagination):
+    # сортировка берётся из OrderingFilter, страницы читаются по индексу
+    # без OFFSET, поэтому глубокие страницы стоят столько же, сколько первая.
+    # DRF держит курсор только по первому полю и внутри группы равных значений
+    # (?ordering=-likes_count) переходит на OFFSET, а порядок в такой группе на PostgreSQL
+    # не определён. Поэтому ключ курсора - все поля сортировки и id в конце, как в индексах (-поле, -id)
+    ordering = '-created_at'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        fields = [field.lstrip('-') for field in ordering]
+        if 'id' in fields or 'pk' in fields:
+            return ordering
+        return (*ordering, '-id' if ordering[-1].startswith('-') else 'id')
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            field = field.lstrip('-')
+            value = instance[field] if isinstance(instance, dict) else getattr(instance, field)
+            values.append(str(value))
+        return json.dumps(values)
+
+    def filter_after(self, queryset, position, reverse):
+        # (a, b, id) > (x, y, z): a > x, или a = x и b > y, или a = x, b = y и id > z
+        try:
+            values = json.loads(position)
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition, equal = Q(), {}
+        for field, value in zip(self.ordering, values):
+            lookup = 'lt' if reverse != field.startswith('-') else 'gt'
+            field = field.lstrip('-')
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return queryset.filter(condition)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # то же, что CursorPagination.paginate_queryset, но позиция фильтруется по паре (поле, id)
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = self.filter_after(queryset, current_position, self.cursor.reverse)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = self._get_position_from_instance(results[-1], self.ordering) \
+            if has_following_position else None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class UserPostsCursorPagination(CursorPagination):
+    # keyset по индексу (user, -id): WHERE user = ... AND id < курсор
+    ordering = '-id'
+    page_size = 50
@@ -0,0 +1,162 @@
+"""Профилирование to_representation сериализаторов на проде.
+
+Профиль снимается для одного запроса, если его попросил сотрудник (заголовок
+X-Profile или ?profile=, значение - 'cprofile' или 'stack'), или случайно для доли
+SERIALIZER_PROFILE_SAMPLE_RATE запросов. Результат пишется в SERIALIZER_PROFILE_DIR:
+  *.prof   - cProfile, открывается snakeviz / flameprof;
+  *.folded - стеки семплера в формате "a;b;c N" для flamegraph.pl / speedscope.
+Имя файла возвращается в заголовке X-Profile.
+
+Время полей (get_attribute + to_representation, включая их запросы к БД)
+копится по всем профилированным запросам и попадает в /api/v1/metrics/.
+Это есть только у сериализаторов с полями DRF: у сериализаторов для чтения
+(PostListReadSerializer, PostReadSerializer) полей нет, по ним - только профиль целиком.
+Ответ из кеша (main_.cache) не сериализуется и не профилируется.
+"""
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+MODES = ('cprofile', 'stack')
+
+
+class FieldStats:
+    """{'PostListSerializer.thumbnail': [вызовов, мс]} по всем профилированным запросам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fields = {}
+
+    def add(self, timings):
+        with self.lock:
+            for name, (calls, total_ms) in timings.items():
+                stats = self.fields.setdefault(name, [0, 0.0])
+                stats[0] += calls
+                stats[1] += total_ms
+
+    def reset(self):
+        with self.lock:
+            self.fields = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: tuple(stats) for name, stats in self.fields.items()}
+
+
+field_stats = FieldStats()
+
+
+def requested_mode(request):
+    """Режим профилирования для запроса DRF или None."""
+    mode = request.headers.get('X-Profile') or request.query_params.get('profile')
+    if mode and request.user.is_staff:
+        return mode if mode in MODES else settings.SERIALIZER_PROFILE_MODE
+    if random.random() < settings.SERIALIZER_PROFILE_SAMPLE_RATE:
+        return settings.SERIALIZER_PROFILE_MODE
+    return None
+
+
+class StackSampler(threading.Thread):
+    """Раз в SERIALIZER_PROFILE_INTERVAL секунд снимает стек потока запроса."""
+
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(settings.SERIALIZER_PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{frame.f_globals.get("__name__", "?")}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+def time_fields(serializer, timings):
+    """Оборачивает get_attribute/to_representation полей сериализатора (у списка - child)."""
+    serializer = getattr(serializer, 'child', serializer)
+    if not isinstance(serializer, serializers.Serializer):
+        # у сериализаторов для чтения (BaseSerializer) полей нет
+        return
+    prefix = type(serializer).__name__
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        key = f'{prefix}.{name}'
+        timings.setdefault(key, [0, 0.0])
+        for method in ('get_attribute', 'to_representation'):
+            setattr(field, method, timed(getattr(field, method), timings[key], count=method == 'get_attribute'))
+
+
+def timed(method, stats, count):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if count:
+                stats[0] += 1
+            stats[1] += (time.perf_counter() - started) * 1000
+    return wrapper
+
+
+def save(name, mode, profiler):
+    directory = settings.SERIALIZER_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    filename = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{name}.{"prof" if mode == "cprofile" else "folded"}'
+    path = os.path.join(directory, filename)
+    if mode == 'cprofile':
+        profiler.dump_stats(path)
+    else:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(f'{stack} {count}\n' for stack, count in profiler.stacks.most_common())
+    # храним только последние SERIALIZER_PROFILE_KEEP профилей
+    files = sorted(os.listdir(directory))
+    for old in files[:max(0, len(files) - settings.SERIALIZER_PROFILE_KEEP)]:
+        os.remove(os.path.join(directory, old))
+    return filename
+
+
+def profile_serializer(serializer, request, name, mode):
+    """Подменяет serializer.to_representation профилирующей обёрткой.
+
+    Имя сохранённого файла кладётся в request.profile_file.
+    """
+    timings = {}
+    time_fields(serializer, timings)
+    to_representation = serializer.to_representation
+
+    def profiled(instance):
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        try:
+            return to_representation(instance)
+        finally:
+            if mode == 'cprofile':
+                profiler.disable()
+            else:
+                profiler.stop()
+            field_stats.add(timings)
+            request.profile_file = save(name, mode, profiler)
+    serializer.to_representation = profiled
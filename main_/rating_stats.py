@@ -0,0 +1,107 @@
+"""Статистика оценок: гистограммы 1..5, байесовское среднее и перцентили по категориям.
+
+Оценки читаются одним GROUP BY (post, rating), дальше всё считается в NumPy
+сразу по всем постам и записывается в Post/Category только там, где изменилось.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from main_.cache import invalidate, invalidate_posts
+from main_.models import Category, Post, Review
+
+STARS = np.arange(1, 6)
+
+
+def bayesian_averages(histograms, prior_weight):
+    """Среднее с поправкой для каждой строки матрицы n x 5.
+
+    К оценкам каждого поста добавляются prior_weight "виртуальных" оценок,
+    равных среднему по всем отзывам, поэтому один отзыв на 5 не выводит пост в топ.
+    """
+    counts = histograms.sum(axis=1)
+    sums = histograms @ STARS
+    total = counts.sum()
+    prior = sums.sum() / total if total else 0.0
+    return (prior * prior_weight + sums) / (prior_weight + counts)
+
+
+def category_percentiles(values, categories, reviewed):
+    """Место поста среди оценённых постов своей категории, 0..100 (None - нет отзывов)."""
+    percentiles = np.full(len(values), np.nan)
+    summaries = {}
+    for category in np.unique(categories):
+        members = (categories == category) & reviewed
+        if not members.any():
+            summaries[str(category)] = {}
+            continue
+        ordered = np.sort(values[members])
+        lower = np.searchsorted(ordered, values[members], side='left')
+        upper = np.searchsorted(ordered, values[members], side='right')
+        # равные значения делят место пополам
+        percentiles[members] = 100 * (lower + (upper - lower) / 2) / len(ordered)
+        points = settings.RATING_PERCENTILES
+        summaries[str(category)] = {str(point): round(float(value), 2)
+                                    for point, value in zip(points, np.percentile(ordered, points))}
+    return percentiles, summaries
+
+
+def rebuild():
+    """Пересчитывает статистику всех постов, возвращает число изменившихся."""
+    posts = list(Post.objects.order_by('pk').values_list(
+        'pk', 'category', 'rating_histogram', 'bayesian_average', 'rating_percentile'))
+    if not posts:
+        return 0
+    ids = np.array([post[0] for post in posts])
+    categories = np.array([post[1] for post in posts])
+    positions = {post_id: index for index, post_id in enumerate(ids.tolist())}
+
+    histograms = np.zeros((len(posts), 5), dtype=np.int64)
+    for post_id, rating, count in Review.objects.order_by().values_list('post', 'rating').annotate(count=Count('id')):
+        # пост мог появиться между двумя запросами, его посчитает следующий запуск
+        if post_id in positions:
+            histograms[positions[post_id], rating - 1] = count
+    averages = bayesian_averages(histograms, settings.RATING_PRIOR_WEIGHT)
+    reviewed = histograms.sum(axis=1) > 0
+    percentiles, summaries = category_percentiles(averages, categories, reviewed)
+
+    now = timezone.now()
+    changed = []
+    for index, (post_id, _, histogram, average, percentile) in enumerate(posts):
+        # округляем, чтобы сдвиг общего среднего на тысячные не переписывал все посты
+        new_histogram = histograms[index].tolist()
+        new_average = round(float(averages[index]), 2)
+        new_percentile = None if np.isnan(percentiles[index]) else round(float(percentiles[index]), 1)
+        if (histogram, average, percentile) != (new_histogram, new_average, new_percentile):
+            changed.append(Post(pk=post_id, rating_histogram=new_histogram, bayesian_average=new_average,
+                                rating_percentile=new_percentile, updated_at=now))
+
+    with transaction.atomic():
+        # updated_at - чтобы ETag детальной страницы сменился
+        Post.objects.bulk_update(changed, ['rating_histogram', 'bayesian_average', 'rating_percentile',
+                                           'updated_at'], batch_size=1000)
+        invalidate_posts([post.pk for post in changed])
+        percentiles_changed = False
+        for category in Category.objects.only('slug', 'rating_percentiles'):
+            summary = summaries.get(category.slug, {})
+            if category.rating_percentiles != summary:
+                Category.objects.filter(pk=category.slug).update(rating_percentiles=summary)
+                percentiles_changed = True
+        if percentiles_changed:
+            # category_percentiles есть в rating_stats всех постов категории, а не только изменившихся
+            invalidate('categories')
+    return len(changed)
+
+
+def post_rating_stats(post):
+    histogram = post.rating_histogram or [0] * 5
+    return {
+        'reviews_count': post.reviews_count,
+        'rating_average': round(post.rating_average, 2) if post.reviews_count else None,
+        'bayesian_average': post.bayesian_average if post.reviews_count and post.rating_histogram else None,
+        'histogram': {str(stars): count for stars, count in zip(STARS.tolist(), histogram)},
+        'category_percentile': post.rating_percentile,
+        'category_percentiles': post.category.rating_percentiles,
+    }
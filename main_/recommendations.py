@@ -0,0 +1,119 @@
+"""Похожие посты по совместным лайкам/избранному (item-item, косинусная мера).
+
+Матрица пользователь x пост собирается из Like и Favorite в scipy.sparse,
+сходство считается блоками по RECOMMENDATIONS_BLOCK_SIZE постов, поэтому в
+памяти одновременно только матрица взаимодействий и один блок X.T @ X.
+"""
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from scipy import sparse
+
+from main_.models import Post, Like, Favorite, SimilarPost
+
+BUILT_AT_KEY = 'recommendations:built_at'
+
+
+def interaction_matrix():
+    """csc-матрица 0/1: строки - пользователи, столбцы - id постов."""
+    users, rows, cols = {}, array('i'), array('i')
+    for model in (Like, Favorite):
+        for user_id, post_id in model.objects.values_list('user_id', 'post_id').iterator(chunk_size=10000):
+            rows.append(users.setdefault(user_id, len(users)))
+            cols.append(post_id)
+    rows, cols = np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32)
+    shape = (len(users), int(cols.max()) + 1 if len(cols) else 0)
+    matrix = sparse.csc_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape)
+    # лайк и избранное от одного пользователя считаем одним взаимодействием
+    matrix.data[:] = 1
+    return matrix
+
+
+def inverse_norms(matrix):
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    return np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+
+
+def top_neighbours(matrix, transposed, inverse, post_ids, k):
+    """{post_id: [(similar_id, score)]} для постов из post_ids."""
+    block = np.asarray(post_ids)
+    # cos(a, b) = |users(a) & users(b)| / (|users(a)| * |users(b)|) ** 0.5
+    scores = sparse.diags(inverse) @ (transposed @ matrix[:, block]) @ sparse.diags(inverse[block])
+    scores = scores.tocsc()
+    result = {}
+    for column, post_id in enumerate(block):
+        start, end = scores.indptr[column], scores.indptr[column + 1]
+        candidates, values = scores.indices[start:end], scores.data[start:end]
+        keep = candidates != post_id
+        candidates, values = candidates[keep], values[keep]
+        if len(values) > k:
+            top = np.argpartition(-values, k)[:k]
+            candidates, values = candidates[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        # float32: дальше шестого знака шум
+        result[int(post_id)] = [(int(candidates[i]), round(float(values[i]), 6)) for i in order]
+    return result
+
+
+def affected_posts(matrix, changed):
+    """Посты, чей список соседей мог измениться из-за changed."""
+    affected = set(changed)
+    in_matrix = [post_id for post_id in changed if post_id < matrix.shape[1]]
+    if in_matrix:
+        users = np.unique(matrix[:, in_matrix].nonzero()[0])
+        by_user = matrix.tocsr()
+        affected.update(int(post_id) for post_id in np.unique(by_user[users].nonzero()[1]))
+    # соседи, с которыми пересечение могло пропасть
+    affected.update(SimilarPost.objects.filter(similar__in=changed).values_list('post_id', flat=True))
+    return affected
+
+
+def rebuild(full=False):
+    """Пересчитывает соседей изменившихся постов, full=True - всех. Возвращает число постов."""
+    started = timezone.now()
+    built_at = None if full else cache.get(BUILT_AT_KEY)
+    posts = Post.objects.all()
+    if built_at is not None:
+        # лайки/избранное обновляют Post.updated_at (см. main_.signals)
+        posts = posts.filter(updated_at__gte=built_at)
+    changed = set(posts.values_list('pk', flat=True))
+
+    matrix = interaction_matrix()
+    affected = sorted(affected_posts(matrix, changed) if built_at is not None else changed)
+    k, size = settings.RECOMMENDATIONS_NEIGHBOURS, settings.RECOMMENDATIONS_BLOCK_SIZE
+    transposed, inverse = matrix.T.tocsr(), inverse_norms(matrix)
+    for index in range(0, len(affected), size):
+        block = affected[index:index + size]
+        in_matrix = [post_id for post_id in block if post_id < matrix.shape[1]]
+        neighbours = top_neighbours(matrix, transposed, inverse, in_matrix, k) if in_matrix else {}
+        existing = set(Post.objects.filter(pk__in=block).values_list('pk', flat=True))
+        with transaction.atomic():
+            SimilarPost.objects.filter(post__in=block).delete()
+            SimilarPost.objects.bulk_create([
+                SimilarPost(post_id=post_id, similar_id=similar_id, score=score)
+                for post_id, pairs in neighbours.items() if post_id in existing
+                for similar_id, score in pairs
+            ])
+    cache.set(BUILT_AT_KEY, started, None)
+    return len(affected)
+
+
+def similar_ids(post_id, limit):
+    return list(SimilarPost.objects.filter(post=post_id).order_by('-score', 'similar')
+                .values_list('similar', flat=True)[:limit])
+
+
+def recommended_ids(user, limit):
+    """Соседи последних лайков и избранного пользователя, кроме уже отмеченных."""
+    history = settings.RECOMMENDATIONS_HISTORY
+    recent = set(user.liked.order_by('-id').values_list('post', flat=True)[:history])
+    recent.update(user.favorited.order_by('-id').values_list('post', flat=True)[:history])
+    rows = SimilarPost.objects.filter(post__in=recent) \
+        .exclude(similar__in=user.liked.values('post')).exclude(similar__in=user.favorited.values('post')) \
+        .values('similar').annotate(total=Sum('score')).order_by('-total', 'similar')[:limit]
+    return [row['similar'] for row in rows]
@@ -0,0 +1,57 @@
+"""JSON через orjson (если установлен) и потоковая отдача длинных списков.
+
+orjson сам сериализует dict/list и их наследников (OrderedDict, ReturnDict, ReturnList),
+datetime/date/time и UUID; остальное (Decimal, ленивые строки, QuerySet) - через
+default из DRF JSONEncoder. Без orjson всё идёт через стандартный JSONRenderer.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+encoder = JSONEncoder()
+
+
+def dumps(data):
+    if orjson is None:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+        content = content.encode()
+    else:
+        # OPT_UTC_Z: '...Z' вместо '+00:00', как у DRF
+        content = orjson.dumps(data, default=encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    # U+2028 и U+2029 ломают JSON, вставленный в <script>, DRF их экранирует
+    return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # отступы (?format=json; indent=4 и т.п.) orjson не умеет, их отдаёт обычный рендерер
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def stream_json_list(rows):
+    """Куски JSON-массива по STREAMING_JSON_CHUNK строк: '[', 'a,b,c', ',d,e', ']'."""
+    rows = iter(rows)
+    yield b'['
+    separator = b''
+    while batch := list(islice(rows, settings.STREAMING_JSON_CHUNK)):
+        yield separator + b','.join(dumps(row) for row in batch)
+        separator = b','
+    yield b']'
+
+
+def streaming_json_response(rows):
+    # rows лучше брать из .iterator(): тогда в памяти только текущая пачка строк
+    return StreamingHttpResponse(stream_json_list(rows), content_type='application/json')
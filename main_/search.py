@@ -0,0 +1,161 @@
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, When, F, Q, Sum, Count, FloatField, Value
+from django.db.models.functions import Length
+from django.utils.html import escape
+from rest_framework.filters import SearchFilter
+
+from main_.models import Post, SearchToken
+
+TOKEN_RE = re.compile(r'\w+')
+TOKEN_MAX_LENGTH = SearchToken._meta.get_field('token').max_length
+TITLE_WEIGHT = 3
+
+# насколько ценится совпадение: точное, по префиксу, с опечаткой
+EXACT_FACTOR = 1.0
+PREFIX_FACTOR = 0.7
+TYPO_FACTOR = 0.5
+PREFIX_VARIANTS = 20
+TYPO_CANDIDATES = 200
+
+
+def tokenize(text):
+    return [token[:TOKEN_MAX_LENGTH] for token in TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def build_tokens(title, text):
+    weights = Counter()
+    for token in tokenize(title):
+        weights[token] += TITLE_WEIGHT
+    for token in tokenize(text):
+        weights[token] += 1
+    return weights
+
+
+def index_post(post):
+    weights = build_tokens(post.title, post.text)
+    with transaction.atomic():
+        SearchToken.objects.filter(post=post).delete()
+        SearchToken.objects.bulk_create([
+            SearchToken(post=post, token=token, weight=weight)
+            for token, weight in weights.items()
+        ])
+
+
+def distance(a, b, limit):
+    # расстояние Левенштейна с ранним выходом, если оно заведомо больше limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def expand(term):
+    """Возвращает {токен из индекса: множитель} для одного слова запроса."""
+    tokens = SearchToken.objects.values_list('token', flat=True).distinct()
+    # короткие первыми: сам term, если он есть в индексе, всегда попадает в выборку
+    prefixed = tokens.filter(token__startswith=term).annotate(length=Length('token')).order_by('length', 'token')
+    variants = {token: PREFIX_FACTOR for token in prefixed[:PREFIX_VARIANTS]}
+    if term in variants:
+        variants[term] = EXACT_FACTOR
+    if variants or len(term) < 4:
+        return variants
+    # опечатка: при limit правках хотя бы один из limit + 1 кусков слова остаётся целым,
+    # поэтому в БД отбираем токены с той же первой буквой, близкой длиной и таким куском
+    limit = 1 if len(term) < 7 else 2
+    size = -(-len(term) // (limit + 1))
+    pieces = Q()
+    for start in range(0, len(term), size):
+        pieces |= Q(token__contains=term[start:start + size])
+    candidates = tokens.annotate(length=Length('token')).filter(
+        pieces,
+        token__startswith=term[0],
+        length__range=(len(term) - limit, len(term) + limit),
+    ).order_by('token')[:TYPO_CANDIDATES]
+    return {token: TYPO_FACTOR for token in candidates
+            if distance(term, token, limit) <= limit}
+
+
+def match_tokens(query):
+    variants = {}
+    for term in set(tokenize(query)):
+        for token, factor in expand(term).items():
+            variants[token] = max(factor, variants.get(token, 0))
+    return variants
+
+
+def search_posts(query):
+    """Возвращает выборку (post_id, score) по убыванию релевантности и множество совпавших токенов.
+
+    Выборка ленивая: пагинатор сам посчитает её размер и прочитает только свою страницу.
+    """
+    variants = match_tokens(query)
+    if not variants:
+        return [], set()
+
+    # idf: редкие слова важнее частых
+    total = Post.objects.count() or 1
+    frequencies = dict(SearchToken.objects.filter(token__in=variants)
+                       .values_list('token').annotate(df=Count('id')))
+    multipliers = {token: factor * math.log(1 + total / frequencies[token])
+                   for token, factor in variants.items() if token in frequencies}
+    if not multipliers:
+        return [], set()
+
+    score = Sum(Case(
+        *[When(token=token, then=F('weight') * Value(multiplier)) for token, multiplier in multipliers.items()],
+        output_field=FloatField()
+    ))
+    rows = SearchToken.objects.filter(token__in=multipliers).values('post') \
+        .annotate(score=score).order_by('-score', 'post').values_list('post', 'score')
+    return rows, set(multipliers)
+
+
+def highlight(text, tokens, snippet_length=None):
+    words = list(TOKEN_RE.finditer(text))
+    matches = [word for word in words if word.group().lower()[:TOKEN_MAX_LENGTH] in tokens]
+    start, end = 0, len(text)
+    if snippet_length and len(text) > snippet_length:
+        center = matches[0].start() if matches else 0
+        start = max(0, center - snippet_length // 2)
+        end = min(len(text), start + snippet_length)
+    parts, position = [], start
+    for word in matches:
+        if word.start() < start or word.end() > end:
+            continue
+        parts.append(escape(text[position:word.start()]))
+        parts.append(f'<mark>{escape(word.group())}</mark>')
+        position = word.end()
+    parts.append(escape(text[position:end]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return prefix + ''.join(parts) + suffix
+
+
+class IndexSearchFilter(SearchFilter):
+    """?search= для списка постов через инвертированный индекс вместо ILIKE.
+
+    Как и у SearchFilter, пост должен совпасть с каждым словом запроса
+    (точно, по префиксу или с опечаткой).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        for term in set(tokenize(query)):
+            variants = expand(term)
+            if not variants:
+                return queryset.none()
+            queryset = queryset.filter(pk__in=SearchToken.objects.filter(token__in=variants).values('post'))
+        return queryset
@@ -1,7 +1,16 @@
+import os
+from functools import cached_property
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from main_.models import Category, Post, PostImage, PostVideo, Favorite, Review, Like
+from main_.images import srcset, thumbnail
+from main_.models import Category, Post, PostImage, PostVideo, Favorite, Review, Like, VideoUpload, \
+    VideoTranscode
 from main_.tasks import send_new_series
 
 User = get_user_model()
@@ -10,55 +19,49 @@ User = get_user_model()
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['rating_percentiles']
 
 
 class PostListSerializer(serializers.ModelSerializer):
     video = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     user = serializers.CharField(source='user.name')
 
     class Meta:
         model = Post
         # exclude = ['user']
-        fields = ['id', 'title', 'text', 'category', 'reviews', 'user', 'created_at', 'image', 'video']
+        fields = ['id', 'title', 'text', 'category', 'reviews', 'user', 'created_at', 'image', 'thumbnail',
+                  'srcset', 'video']
 
     def get_image(self, post):
-        first_image = post.pics.first()
-        if first_image and first_image.image:
-            return first_image.image.url
+        # first_image / first_video аннотируются в PostViewSet.get_queryset
+        if post.first_image:
+            return PostImage._meta.get_field('image').storage.url(post.first_image)
         return ''
 
-    def get_video(self, post):
-        first_video = post.trailer.first()
-        if first_video and first_video.video:
-            return first_video.video.url
-        return ''
+    def get_thumbnail(self, post):
+        return thumbnail(post.first_image_variants or [], PostImage._meta.get_field('image').storage)
 
-    def is_favorited(self, post):
-        user = self.context.get('request').user
-        return user.favorited.filter(post=post).exists()
+    def get_srcset(self, post):
+        return srcset(post.first_image_variants or [], PostImage._meta.get_field('image').storage)
 
-    def is_liked(self, post):
-        user = self.context.get('request').user
-        return user.liked.filter(post=post).exists()
+    def get_video(self, post):
+        if post.first_video:
+            return PostVideo._meta.get_field('video').storage.url(post.first_video)
+        return ''
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         user = self.context.get('request').user
         if user.is_authenticated:
-            representation['is_favorited'] = self.is_favorited(instance)
-            representation['is_liked'] = self.is_liked(instance)
-        representation['likes_count'] = instance.likes.count()
-        rating = ReviewSerializer(instance.reviews.all(), many=True).data
-        try:
-            fl = 0
-            for ordered_dict in rating:
-                fl += ordered_dict.get('rating')
-            representation['rating_average'] = round(fl / instance.reviews.all().count(), 1)
-            return representation
-        except ZeroDivisionError:
-            return representation
+            representation['is_favorited'] = instance.is_favorited
+            representation['is_liked'] = instance.is_liked
+        representation['likes_count'] = instance.likes_count
+        if instance.reviews_count:
+            representation['rating_average'] = round(instance.rating_average, 1)
+        return representation
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -96,58 +99,112 @@ class ReviewSerializer(serializers.ModelSerializer):
     #     return super().create(validated_data)
 
 
-class FavoritesListSerializer(serializers.ModelSerializer):
+class PostSummarySerializer(serializers.ModelSerializer):
+    rating_average = serializers.SerializerMethodField()
+
     class Meta:
-        model = Favorite
-        fields = ['user']
+        model = Post
+        fields = ['id', 'title', 'category', 'likes_count', 'rating_average']
 
-    user = serializers.EmailField(required=True)
+    def get_rating_average(self, post):
+        if post.reviews_count:
+            return round(post.rating_average, 1)
+        return None
 
-    def validate_user(self, email):
-        if not User.objects.filter(email=email).exists():
-            raise serializers.ValidationError('Пользователь не найден')
-        return email
 
-    def validate(self, attrs):
-        user = attrs.get('user')
-        favorites_queryset = Favorite.objects.filter(user=user)
-        favorites_queryset = [favorites_queryset[i] for i in range(len(favorites_queryset))]
-        favorites = [str(favorites_queryset[i]) for i in range(len(favorites_queryset))]
-        attrs['user'] = favorites
-        return attrs
+class FavoritesListSerializer(serializers.ModelSerializer):
+    post = PostSummarySerializer()
+
+    class Meta:
+        model = Favorite
+        fields = ['id', 'post']
 
 
 class LikesListSerializer(serializers.ModelSerializer):
+    post = PostSummarySerializer()
+
     class Meta:
         model = Like
-        fields = ['user']
+        fields = ['id', 'post']
 
-    user = serializers.EmailField(required=True)
 
-    def validate_user(self, email):
-        if not User.objects.filter(email=email).exists():
-            raise serializers.ValidationError('Пользователь не найден')
-        return email
+class BulkToggleSerializer(serializers.Serializer):
+    add = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
 
     def validate(self, attrs):
-        user = attrs.get('user')
-        likes_queryset = Like.objects.filter(user=user)
-        likes_queryset = [likes_queryset[i] for i in range(len(likes_queryset))]
-        likes = [str(likes_queryset[i]) for i in range(len(likes_queryset))]
-        attrs['user'] = likes
+        add = set(attrs.get('add', []))
+        remove = set(attrs.get('remove', []))
+        if not add and not remove:
+            raise serializers.ValidationError('Передайте id фильмов в add или remove')
+        if add & remove:
+            raise serializers.ValidationError('Один и тот же фильм не может быть в add и remove')
+        attrs['add'], attrs['remove'] = add, remove
         return attrs
 
 
+class VideoUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'post', 'filename', 'size', 'sha256', 'received', 'video']
+        read_only_fields = ['received', 'video']
+
+    def validate_size(self, size):
+        if not 0 < size <= settings.VIDEO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('Недопустимый размер файла')
+        return size
+
+    def validate_filename(self, filename):
+        # проверяем при старте, а не в complete_upload, когда файл уже загружен целиком
+        if not filename or os.path.basename(filename) != filename:
+            raise serializers.ValidationError('Имя файла не должно содержать путь')
+        try:
+            return PostVideo._meta.get_field('video').storage.get_valid_name(filename)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError('Недопустимое имя файла')
+
+    def create(self, validated_data):
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
+
+
 class PostImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = PostImage
-        fields = ['image']
+        fields = ['image', 'srcset']
+
+    def get_srcset(self, post_image):
+        return srcset(post_image.variants, post_image.image.storage)
 
 
 class PostVideoSerializer(serializers.ModelSerializer):
+    hls = serializers.SerializerMethodField()
+
     class Meta:
         model = PostVideo
-        fields = ['video']
+        fields = ['video', 'hls']
+
+    def get_hls(self, post_video):
+        transcode = getattr(post_video, 'transcode', None)
+        if transcode is None or transcode.status != VideoTranscode.DONE:
+            return None
+        storage = post_video.video.storage
+        return {
+            'manifest': storage.url(transcode.manifest),
+            'poster': storage.url(transcode.poster),
+            'duration': transcode.duration,
+        }
+
+
+def add_rating_stats(representation, post):
+    # bayesian_average и гистограмму пересчитывает по расписанию rebuild_rating_stats,
+    # до первого пересчёта поста их в ответе нет
+    if post.rating_histogram:
+        representation['bayesian_average'] = round(post.bayesian_average, 1)
+        representation['rating_histogram'] = post.rating_histogram
+    return representation
 
 
 class PostSerializer(serializers.ModelSerializer):
@@ -172,7 +229,7 @@ class PostSerializer(serializers.ModelSerializer):
             PostVideo.objects.create(post=post, video=video)
         for image in images:
             PostImage.objects.create(post=post, image=image)
-        send_new_series.delay()
+        transaction.on_commit(lambda: send_new_series.delay(post.id))
         return post
 
     def update(self, instance, validated_data):
@@ -197,20 +254,122 @@ class PostSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['images'] = PostImageSerializer(instance.pics.all(), many=True).data
-        representation['videos'] = PostVideoSerializer(instance.trailer.all(), many=True).data
+        representation['videos'] = PostVideoSerializer(instance.trailer.select_related('transcode'), many=True).data
         representation['reviews'] = ReviewSerializer(instance.reviews.all(), many=True).data
         user = self.context.get('request').user
         if user.is_authenticated:
             representation['is_favorited'] = self.is_favorited(instance)
             representation['is_liked'] = self.is_liked(instance)
-        representation['likes_count'] = instance.likes.count()
-        rating = ReviewSerializer(instance.reviews.all(), many=True).data
-        try:
-            fl = 0
-            for ordered_dict in rating:
-                fl += ordered_dict.get('rating')
-            representation['rating_average'] = round(fl / instance.reviews.all().count(), 1)
-            return representation
-        except ZeroDivisionError:
-            return representation
-
+        representation['likes_count'] = instance.likes_count
+        if instance.reviews_count:
+            representation['rating_average'] = round(instance.rating_average, 1)
+            add_rating_stats(representation, instance)
+        return representation
+
+
+# Сериализаторы только для чтения: тот же JSON, что у PostListSerializer, PostSerializer
+# и ReviewSerializer, но словари собираются напрямую, без полей DRF и их to_representation.
+# При изменении полей старых сериализаторов поправьте и эти (см. ReadSerializersParityTest).
+
+def format_datetime(value, tz):
+    # как DateTimeField с DATETIME_FORMAT = ISO_8601
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def iter_review_rows(queryset, chunk_size=2000):
+    # iterator(): на PostgreSQL строки читаются серверным курсором пачками по chunk_size
+    tz = timezone.get_current_timezone()
+    rows = queryset.values_list('id', 'text', 'rating', 'created_at').iterator(chunk_size=chunk_size)
+    for pk, text, rating, created_at in rows:
+        yield {'id': pk, 'text': text, 'rating': rating, 'created_at': format_datetime(created_at, tz)}
+
+
+def review_rows(queryset):
+    return list(iter_review_rows(queryset))
+
+
+class PostReadMixin:
+    # child у many=True один на все строки, поэтому всё общее считается один раз
+
+    @cached_property
+    def tz(self):
+        return timezone.get_current_timezone()
+
+    @cached_property
+    def user(self):
+        return self.context['request'].user
+
+    @cached_property
+    def image_storage(self):
+        return PostImage._meta.get_field('image').storage
+
+    @cached_property
+    def video_storage(self):
+        return PostVideo._meta.get_field('video').storage
+
+    def add_counters(self, representation, post, detail=False):
+        representation['likes_count'] = post.likes_count
+        if post.reviews_count:
+            representation['rating_average'] = round(post.rating_average, 1)
+            if detail:
+                add_rating_stats(representation, post)
+        return representation
+
+
+class PostListReadSerializer(PostReadMixin, serializers.BaseSerializer):
+    """PostListSerializer для выборок из annotate_post_list."""
+
+    def to_representation(self, post):
+        storage = self.image_storage
+        variants = post.first_image_variants or []
+        user = post.user
+        representation = {
+            'id': post.id,
+            'title': post.title,
+            'text': post.text,
+            'category': post.category_id,
+            'reviews': [review.pk for review in post.reviews.all()],
+            'user': user.name if user is not None else None,
+            'created_at': format_datetime(post.created_at, self.tz),
+            'image': storage.url(post.first_image) if post.first_image else '',
+            'thumbnail': thumbnail(variants, storage),
+            'srcset': srcset(variants, storage),
+            'video': self.video_storage.url(post.first_video) if post.first_video else '',
+        }
+        if self.user.is_authenticated:
+            representation['is_favorited'] = post.is_favorited
+            representation['is_liked'] = post.is_liked
+        return self.add_counters(representation, post)
+
+
+class PostReadSerializer(PostReadMixin, serializers.BaseSerializer):
+    """Ответ PostSerializer для детальной страницы: отзывы читаются один раз, медиа - через values_list."""
+
+    def to_representation(self, post):
+        image_storage, video_storage = self.image_storage, self.video_storage
+        representation = {
+            'id': post.id,
+            'title': post.title,
+            'text': post.text,
+            'category': post.category_id,
+            'reviews': review_rows(post.reviews.all()),
+            'created_at': format_datetime(post.created_at, self.tz),
+            'images': [
+                {'image': image_storage.url(name) if name else None, 'srcset': srcset(variants, image_storage)}
+                for name, variants in post.pics.values_list('image', 'variants')
+            ],
+            'videos': [
+                {'video': video_storage.url(name) if name else None,
+                 'hls': {'manifest': video_storage.url(manifest), 'poster': video_storage.url(poster),
+                         'duration': duration} if status == VideoTranscode.DONE else None}
+                for name, status, manifest, poster, duration in post.trailer.values_list(
+                    'video', 'transcode__status', 'transcode__manifest', 'transcode__poster', 'transcode__duration')
+            ],
+        }
+        if self.user.is_authenticated:
+            representation['is_favorited'] = self.user.favorited.filter(post=post).exists()
+            representation['is_liked'] = self.user.liked.filter(post=post).exists()
+        return self.add_counters(representation, post, detail=True)
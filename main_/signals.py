@@ -0,0 +1,93 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from main_.cache import invalidate, invalidate_post, invalidate_posts
+from main_.models import Category, Post, PostImage, PostVideo, VideoTranscode, Review, Like, Favorite
+from main_.search import index_post
+from main_.tasks import process_post_image, transcode_video
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_post_changes():
+    """Собирает id изменённых постов и обновляет их одним запросом на выходе.
+
+    Внутри блока можно добавлять id и вручную - для bulk_create сигналы не шлются.
+    """
+    _batch.post_ids = post_ids = set()
+    try:
+        yield post_ids
+    finally:
+        _batch.post_ids = None
+    if post_ids:
+        Post.objects.filter(pk__in=post_ids).update(updated_at=timezone.now())
+        invalidate_posts(post_ids)
+
+
+@receiver(post_save, sender=Post)
+def update_search_index(sender, instance, **kwargs):
+    index_post(instance)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    invalidate_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=PostImage)
+@receiver([post_save, post_delete], sender=PostVideo)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_related_cache(sender, instance, **kwargs):
+    post_ids = getattr(_batch, 'post_ids', None)
+    if post_ids is not None:
+        post_ids.add(instance.post_id)
+        return
+    Post.touch(instance.post_id)
+    invalidate_post(instance.post_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    invalidate('categories')
+
+
+def file_changed(instance, field):
+    return getattr(instance, field).name != getattr(instance, '_previous_file', None)
+
+
+@receiver(pre_save, sender=PostImage)
+@receiver(pre_save, sender=PostVideo)
+def remember_previous_file(sender, instance, **kwargs):
+    field = 'image' if sender is PostImage else 'video'
+    instance._previous_file = None
+    if instance.pk:
+        instance._previous_file = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    if sender is PostImage and file_changed(instance, field):
+        # варианты старой картинки больше не подходят
+        instance.variants = []
+
+
+@receiver(post_save, sender=PostImage)
+def schedule_image_processing(sender, instance, created, **kwargs):
+    # из PostSerializer и из PostImageInline в админке
+    if instance.image and (created or file_changed(instance, 'image')):
+        transaction.on_commit(lambda: process_post_image.delay(instance.pk))
+
+
+@receiver(post_save, sender=PostVideo)
+def schedule_transcoding(sender, instance, created, **kwargs):
+    if instance.video and (created or file_changed(instance, 'video')):
+        VideoTranscode.objects.update_or_create(video=instance, defaults={
+            'status': VideoTranscode.PENDING, 'manifest': '', 'poster': '', 'duration': None,
+            'renditions': [], 'error': '',
+        })
+        transaction.on_commit(lambda: transcode_video.delay(instance.pk))
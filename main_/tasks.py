@@ -1,6 +1,20 @@
+import os
+import subprocess
+from datetime import timedelta
+from smtplib import SMTPException
+
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
+from django.core.mail import get_connection, EmailMessage
+from django.utils import timezone
+
+from main_.cache import invalidate_post
+from main_.images import build_variants
+from main_.leaderboards import decay_trending
+from main_ import rating_stats, recommendations
+from main_.models import Post, PostImage, PostVideo, VideoTranscode, NewSeriesNotification, VideoUpload
+from main_.transcoding import transcode
 
 
 @shared_task
@@ -8,15 +22,152 @@ def adding_task(x, y):
     return x + y
 
 
+def recipient_chunks(exclude=None):
+    """Активные пользователи чанками по NEW_SERIES_CHUNK_SIZE адресов."""
+    emails = get_user_model().objects.filter(is_active=True).exclude(pk=exclude) \
+        .order_by('pk').values_list('email', flat=True)
+    chunk = []
+    for email in emails.iterator(chunk_size=settings.NEW_SERIES_CHUNK_SIZE):
+        chunk.append(email)
+        if len(chunk) == settings.NEW_SERIES_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@shared_task
+def send_new_series(post_id):
+    # раскладываем получателей на чанки, каждый чанк - отдельная задача
+    post = Post.objects.filter(pk=post_id).only('user').first()
+    if post is None:
+        return 0
+    chunks = 0
+    for chunk in recipient_chunks(exclude=post.user_id):
+        send_new_series_chunk.delay(post_id, chunk)
+        chunks += 1
+    return chunks
+
+
+@shared_task(bind=True, max_retries=5, rate_limit=settings.NEW_SERIES_RATE_LIMIT)
+def send_new_series_chunk(self, post_id, emails):
+    post = Post.objects.filter(pk=post_id).only('title').first()
+    if post is None:
+        return 0
+    already_sent = set(NewSeriesNotification.objects.filter(post_id=post_id, user_id__in=emails)
+                       .values_list('user_id', flat=True))
+    sent = []
+    try:
+        # одно SMTP-соединение на весь чанк
+        with get_connection() as connection:
+            for email in emails:
+                if email in already_sent:
+                    continue
+                EmailMessage('Уведомление',
+                             f'Вышел новый фильм: {post.title}',
+                             'test@gmail.com',
+                             [email],
+                             connection=connection).send()
+                sent.append(email)
+    except (SMTPException, OSError) as exc:
+        raise self.retry(exc=exc, countdown=60 * 2 ** self.request.retries)
+    finally:
+        NewSeriesNotification.objects.bulk_create(
+            [NewSeriesNotification(post_id=post_id, user_id=email) for email in sent],
+            ignore_conflicts=True
+        )
+    return len(sent)
+
+
+@shared_task
+def send_catalogue_digest(post_ids):
+    """Одно письмо со списком фильмов вместо письма на каждый импортированный фильм."""
+    titles = list(Post.objects.filter(pk__in=post_ids).order_by('pk')
+                  .values_list('title', flat=True)[:settings.CATALOGUE_DIGEST_TITLES])
+    if not titles:
+        return 0
+    body = 'Вышли новые фильмы:\n' + '\n'.join(f'- {title}' for title in titles)
+    if len(post_ids) > len(titles):
+        body += f'\nи ещё {len(post_ids) - len(titles)}'
+    chunks = 0
+    for chunk in recipient_chunks():
+        send_digest_chunk.delay(body, chunk)
+        chunks += 1
+    return chunks
+
+
+@shared_task(bind=True, max_retries=5, rate_limit=settings.NEW_SERIES_RATE_LIMIT)
+def send_digest_chunk(self, body, emails):
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for email in emails:
+                EmailMessage('Новые фильмы', body, 'test@gmail.com', [email], connection=connection).send()
+                sent += 1
+    except (SMTPException, OSError) as exc:
+        # повторяем только тем, кому письмо ещё не ушло
+        raise self.retry(args=(body, emails[sent:]), exc=exc, countdown=60 * 2 ** self.request.retries)
+    return sent
+
+
+@shared_task
+def process_post_image(image_id):
+    post_image = PostImage.objects.filter(pk=image_id).first()
+    if post_image is None or not post_image.image:
+        return 0
+    variants = build_variants(post_image.image)
+    # update, а не save: не запускаем обработку повторно через сигнал
+    PostImage.objects.filter(pk=image_id, image=post_image.image.name).update(variants=variants)
+    Post.touch(post_image.post_id)
+    invalidate_post(post_image.post_id)
+    return len(variants)
+
+
+@shared_task
+def cleanup_video_uploads():
+    # брошенные незавершённые загрузки старше суток
+    stale = VideoUpload.objects.filter(video__isnull=True, created_at__lt=timezone.now() - timedelta(days=1))
+    for upload in stale:
+        if os.path.exists(upload.temp_path):
+            os.remove(upload.temp_path)
+    return stale.delete()[0]
+
+
+@shared_task
+def decay_trending_scores():
+    return decay_trending()
+
+
+@shared_task
+def rebuild_rating_stats():
+    return rating_stats.rebuild()
+
+
+@shared_task
+def rebuild_recommendations(full=False):
+    return recommendations.rebuild(full)
+
+
 @shared_task
-def send_new_series():
-    user = get_user_model().objects.all()
-    user = [str(user[i]) for i in range(len(user))]
-    user.remove('ata6ek@gmail.com')
-    print(user)
-    text = f'Вышел новый фильм'
-    send_mail('Уведомление',
-              text,
-              'test@gmail.com',
-              user)
-    return text
+def transcode_video(video_id):
+    post_video = PostVideo.objects.filter(pk=video_id).first()
+    if post_video is None or not post_video.video:
+        return None
+    job, _ = VideoTranscode.objects.get_or_create(video=post_video)
+    job.status = VideoTranscode.PROCESSING
+    job.save(update_fields=['status', 'updated_at'])
+    try:
+        result = transcode(post_video)
+    except (subprocess.CalledProcessError, OSError, ValueError, KeyError) as exc:
+        job.status = VideoTranscode.FAILED
+        job.error = getattr(exc, 'stderr', None) or str(exc)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return job.status
+    for field, value in result.items():
+        setattr(job, field, value)
+    job.status = VideoTranscode.DONE
+    job.error = ''
+    job.save()
+    Post.touch(post_video.post_id)
+    invalidate_post(post_video.post_id)
+    return job.status
@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import tempfile
+from base64 import b64decode
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from main_ import benchmark, instrumentation, profiling, renderers
+from main_.views import annotate_post_list
+from main_.models import Category, Post, PostImage, PostVideo, Review, Like, Favorite, NewSeriesNotification, \
+    VideoUpload, VideoTranscode, SimilarPost, SearchToken
+from main_.search import expand, PREFIX_VARIANTS
+from main_.serializers import PostListSerializer, PostSerializer, ReviewSerializer, PostListReadSerializer, \
+    PostReadSerializer, review_rows
+from main_.tasks import send_new_series, send_new_series_chunk, process_post_image, transcode_video, \
+    decay_trending_scores, rebuild_recommendations, rebuild_rating_stats, send_catalogue_digest
+
+User = get_user_model()
+
+
+# бюджет запросов меряем без кеша ответов
+@override_settings(API_CACHE_TIMEOUT=0)
+class PostListQueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        posts = Post.objects.bulk_create([
+            Post(title=f'Фильм {i}', text='Описание', user=cls.user, category=category)
+            for i in range(500)
+        ])
+        PostImage.objects.bulk_create([PostImage(post=post, image='posts/aot.jpg') for post in posts])
+        PostVideo.objects.bulk_create([PostVideo(post=post, video='posts/aot.mp4') for post in posts])
+        Review.objects.bulk_create([
+            Review(post=post, user=cls.user, text='Отзыв', rating=i % 5 + 1)
+            for i, post in enumerate(posts)
+        ])
+        Like.objects.bulk_create([Like(post=post, user=cls.user) for post in posts[::2]])
+        Favorite.objects.bulk_create([Favorite(post=post, user=cls.user) for post in posts[1::2]])
+        call_command('rebuild_post_counters', stdout=StringIO())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # count для пагинации + страница постов + prefetch отзывов, ETag - из версии в кеше
+        for page_size in (3, 50, 500):
+            with self.subTest(page_size=page_size), \
+                    mock.patch.object(PageNumberPagination, 'page_size', page_size):
+                with self.assertNumQueries(3):
+                    response = self.client.get('/api/v1/posts/')
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_anonymous_query_count(self):
+        self.client.force_authenticate(None)
+        with mock.patch.object(PageNumberPagination, 'page_size', 50):
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/v1/posts/')
+        self.assertNotIn('is_liked', response.data['results'][0])
+
+    def test_annotated_values(self):
+        post = Post.objects.order_by('id').first()
+        other = User.objects.create_user('other@gmail.com', '12345678', is_active=True)
+        self.client.force_authenticate(other)
+        self.client.post('/api/v1/reviews/', {'post': post.id, 'text': 'Ещё', 'rating': 2})
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(PageNumberPagination, 'page_size', 500):
+            response = self.client.get('/api/v1/posts/')
+        data = {item['id']: item for item in response.data['results']}[post.id]
+        self.assertEqual(data['likes_count'], 1)
+        self.assertEqual(data['rating_average'], 1.5)
+        self.assertTrue(data['is_liked'])
+        self.assertFalse(data['is_favorited'])
+        self.assertEqual(data['user'], 'User')
+        self.assertTrue(data['image'].endswith('posts/aot.jpg'))
+        self.assertEqual(len(data['reviews']), 2)
+
+
+class PostCountersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Фильм', text='Описание', user=self.user, category=category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCounters(self, **expected):
+        self.post.refresh_from_db()
+        for field, value in expected.items():
+            self.assertEqual(getattr(self.post, field), value, field)
+
+    def test_like_and_favorite_actions(self):
+        url = f'/api/v1/posts/{self.post.id}/'
+        self.client.post(url + 'like/')
+        self.client.post(url + 'like/')
+        self.client.post(url + 'add_to_favorites/')
+        self.assertCounters(likes_count=1, favorites_count=1)
+        self.client.post(url + 'dislike/')
+        self.client.post(url + 'dislike/')
+        self.client.post(url + 'remove_from_favorites/')
+        self.assertCounters(likes_count=0, favorites_count=0)
+
+    def test_review_actions(self):
+        response = self.client.post('/api/v1/reviews/', {'post': self.post.id, 'text': 'Отзыв', 'rating': 4})
+        self.assertCounters(reviews_count=1, rating_sum=4)
+        review_id = response.data['id']
+        self.client.patch(f'/api/v1/reviews/{review_id}/', {'rating': 2})
+        self.assertCounters(reviews_count=1, rating_sum=2)
+        response = self.client.get(f'/api/v1/posts/{self.post.id}/')
+        self.assertEqual(response.data['rating_average'], 2)
+        self.client.delete(f'/api/v1/reviews/{review_id}/')
+        self.assertCounters(reviews_count=0, rating_sum=0)
+
+    def test_rebuild_command_reports_drift(self):
+        Like.objects.create(post=self.post, user=self.user)
+        Review.objects.create(post=self.post, user=self.user, text='Отзыв', rating=5)
+        out = StringIO()
+        call_command('rebuild_post_counters', '--dry-run', stdout=out)
+        self.assertIn(f'Пост {self.post.id}', out.getvalue())
+        self.assertCounters(likes_count=0, reviews_count=0)
+        other = Post.objects.create(title='Другой', text='Описание', user=self.user, category=self.post.category)
+        Favorite.objects.create(post=other, user=self.user)
+        updated_at = Post.objects.get(pk=self.post.pk).updated_at
+        with self.captureOnCommitCallbacks() as callbacks:
+            call_command('rebuild_post_counters', stdout=StringIO())
+        # все посты инвалидируются одним обновлением версий
+        self.assertEqual(len(callbacks), 1)
+        self.assertCounters(likes_count=1, favorites_count=0, reviews_count=1, rating_sum=5)
+        self.assertGreater(Post.objects.get(pk=self.post.pk).updated_at, updated_at)
+
+
+class PostOrderingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        for i, (title, likes, rating_sum, reviews) in enumerate([
+            ('Астрал', 5, 8, 2),
+            ('Бэтмен', 1, 5, 1),
+            ('Восток', 3, 0, 0),
+            ('Гравитация', 9, 9, 3),
+        ]):
+            Post.objects.create(title=title, text='Описание', user=user, category=category,
+                                likes_count=likes, rating_sum=rating_sum, reviews_count=reviews,
+                                rating_average=rating_sum / reviews if reviews else 0)
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, url):
+        titles = []
+        while url:
+            response = self.client.get(url)
+            titles += [post['title'] for post in response.data['results']]
+            url = response.data['next']
+        return titles
+
+    def test_cursor_pages_follow_ordering(self):
+        self.assertEqual(self.collect('/api/v1/posts/?ordering=-rating_average'),
+                         ['Бэтмен', 'Астрал', 'Гравитация', 'Восток'])
+        self.assertEqual(self.collect('/api/v1/posts/?ordering=-likes_count'),
+                         ['Гравитация', 'Астрал', 'Восток', 'Бэтмен'])
+        self.assertEqual(self.collect('/api/v1/posts/?ordering=title'),
+                         ['Астрал', 'Бэтмен', 'Восток', 'Гравитация'])
+
+    def test_cursor_pages_with_ties(self):
+        posts = Post.objects.order_by('id')
+        user, category = posts[0].user, posts[0].category
+        Post.objects.bulk_create([Post(title=f'Фильм {i}', text='Описание', user=user, category=category,
+                                       likes_count=3) for i in range(7)])
+        expected = list(Post.objects.order_by('-likes_count', '-id').values_list('title', flat=True))
+        self.assertEqual(self.collect('/api/v1/posts/?ordering=-likes_count'), expected)
+        expected = list(Post.objects.order_by('likes_count', 'id').values_list('title', flat=True))
+        self.assertEqual(self.collect('/api/v1/posts/?ordering=likes_count'), expected)
+
+        # ссылка назад возвращает ту же страницу, курсор без OFFSET
+        first = self.client.get('/api/v1/posts/?ordering=-likes_count')
+        second = self.client.get(first.data['next'])
+        cursor = parse_qs(urlparse(second.data['next']).query)['cursor'][0]
+        self.assertNotIn('o', parse_qs(b64decode(cursor).decode()))
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_cursor_pages_with_two_fields(self):
+        posts = Post.objects.order_by('id')
+        user, category = posts[0].user, posts[0].category
+        Post.objects.bulk_create([Post(title=title, text='Описание', user=user, category=category, likes_count=3)
+                                  for title in ['Яга', 'Ад', 'Дюна', 'Ад', 'Мост', 'Бал']])
+        for ordering in ('-likes_count,title', 'likes_count,-title'):
+            with self.subTest(ordering=ordering):
+                fields = ordering.split(',')
+                tiebreaker = '-id' if fields[-1].startswith('-') else 'id'
+                expected = list(Post.objects.order_by(*fields, tiebreaker).values_list('title', flat=True))
+                self.assertEqual(self.collect(f'/api/v1/posts/?ordering={ordering}'), expected)
+
+    def test_cursor_pagination_only_with_ordering(self):
+        self.assertIn('cursor=', self.client.get('/api/v1/posts/?ordering=title').data['next'])
+        self.assertIn('page=2', self.client.get('/api/v1/posts/').data['next'])
+
+
+class PostSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        cls.astral = Post.objects.create(title='Астрал', text='Семья переезжает в новый дом',
+                                         user=user, category=category)
+        cls.house = Post.objects.create(title='Дом', text='Призраки и астрал в старом доме',
+                                        user=user, category=category)
+        cls.spider = Post.objects.create(title='Человек-паук', text='Питер Паркер спасает город',
+                                         user=user, category=category)
+
+    def search(self, query):
+        return self.client.get('/api/v1/posts/search/', {'q': query}).data['results']
+
+    def test_title_match_ranks_first(self):
+        results = self.search('астрал')
+        self.assertEqual([post['id'] for post in results], [self.astral.id, self.house.id])
+        self.assertEqual(results[0]['highlight']['title'], '<mark>Астрал</mark>')
+        self.assertIn('<mark>астрал</mark>', results[1]['highlight']['text'])
+
+    def test_typo_and_prefix(self):
+        self.assertEqual([post['id'] for post in self.search('паркр')], [self.spider.id])
+        self.assertEqual([post['id'] for post in self.search('паук')], [self.spider.id])
+        self.assertEqual([post['id'] for post in self.search('челов')], [self.spider.id])
+
+    def test_index_follows_post_updates(self):
+        self.spider.title = 'Веном'
+        self.spider.save()
+        self.assertEqual(self.search('человек'), [])
+        self.assertEqual([post['id'] for post in self.search('веном')], [self.spider.id])
+
+    def test_list_search_param_uses_index(self):
+        response = self.client.get('/api/v1/posts/', {'search': 'дом'})
+        self.assertEqual({post['id'] for post in response.data['results']}, {self.astral.id, self.house.id})
+
+    def test_list_search_param_matches_every_word(self):
+        response = self.client.get('/api/v1/posts/', {'search': 'астрал семья'})
+        self.assertEqual([post['id'] for post in response.data['results']], [self.astral.id])
+        self.assertEqual(self.client.get('/api/v1/posts/', {'search': 'астрал веном'}).data['results'], [])
+
+    def test_exact_token_among_many_prefixes(self):
+        SearchToken.objects.bulk_create([
+            SearchToken(post=self.spider, token=f'дом{i:02}', weight=1) for i in range(PREFIX_VARIANTS + 5)
+        ])
+        self.assertEqual(expand('дом')['дом'], 1.0)
+
+    def test_search_is_not_capped(self):
+        posts = Post.objects.bulk_create([
+            Post(title='Клоун', text='Описание', user=self.spider.user, category=self.spider.category)
+            for _ in range(120)
+        ])
+        SearchToken.objects.bulk_create([SearchToken(post=post, token='клоун', weight=3) for post in posts])
+        response = self.client.get('/api/v1/posts/search/', {'q': 'клоун', 'page': 3})
+        self.assertEqual(response.data['count'], 120)
+        self.assertTrue(response.data['results'])
+
+
+class PostCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        self.category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Фильм', text='Описание', user=self.user, category=self.category)
+        self.client = APIClient()
+
+    def test_cache_outage_fails_open(self):
+        error = RedisConnectionError('Connection refused')
+        methods = ('get', 'set', 'add', 'get_many', 'set_many')
+        broken = mock.Mock(**{f'{method}.side_effect': error for method in methods})
+        self.client.force_authenticate(self.user)
+        with mock.patch('main_.cache.cache', broken), self.assertLogs('main_.cache', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/v1/reviews/', {'post': self.post.id, 'text': 'Отзыв', 'rating': 4})
+            self.assertEqual(response.status_code, 201)
+            response = self.client.get('/api/v1/posts/')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response)
+            self.assertEqual(response.data['results'][0]['reviews'], [Review.objects.get().pk])
+
+    def test_anonymous_reads_are_cached(self):
+        # у детальной страницы остаётся только запрос для ETag, у списка - ни одного
+        self.client.get('/api/v1/posts/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/posts/')
+        self.assertEqual(response.data['results'][0]['title'], 'Фильм')
+        self.client.get(f'/api/v1/posts/{self.post.id}/')
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/v1/posts/{self.post.id}/')
+
+    def test_user_flags_are_merged_into_shared_payload(self):
+        Like.objects.create(post=self.post, user=self.user)
+        self.client.get('/api/v1/posts/')
+        self.client.force_authenticate(self.user)
+        # общий ответ из кеша + по запросу на лайки и избранное
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/posts/')
+        self.assertTrue(response.data['results'][0]['is_liked'])
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+        self.client.force_authenticate(None)
+        self.assertNotIn('is_liked', self.client.get('/api/v1/posts/').data['results'][0])
+
+    def test_changes_invalidate_cache(self):
+        self.client.get('/api/v1/posts/')
+        self.client.get(f'/api/v1/posts/{self.post.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(post=self.post, user=self.user, text='Отзыв', rating=5)
+        response = self.client.get(f'/api/v1/posts/{self.post.id}/')
+        self.assertEqual(len(response.data['reviews']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Новое название'
+            self.post.save()
+        self.assertEqual(self.client.get('/api/v1/posts/').data['results'][0]['title'], 'Новое название')
+        self.client.get('/api/v1/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Комедии', slug='comedy')
+        self.assertEqual(len(self.client.get('/api/v1/categories/').data['results']), 2)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Фильм', text='Описание', user=self.user, category=category)
+        self.client = APIClient()
+
+    def assertNotModified(self, url, queries=1, **headers):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag(self):
+        for url, queries in [(f'/api/v1/posts/{self.post.id}/', 1), (f'/api/v1/posts/{self.post.id}/reviews/', 1),
+                             ('/api/v1/posts/', 0), ('/api/v1/categories/', 1)]:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertNotModified(url, queries, HTTP_IF_NONE_MATCH=etag)
+
+    def test_list_etag_changes_with_posts(self):
+        etag = self.client.get('/api/v1/posts/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.user)
+        self.assertEqual(self.client.get('/api/v1/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified(self):
+        url = f'/api/v1/posts/{self.post.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    def test_related_changes_update_etag(self):
+        url = f'/api/v1/posts/{self.post.id}/'
+        etag = self.client.get(url)['ETag']
+        Like.objects.create(post=self.post, user=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user(self):
+        url = f'/api/v1/posts/{self.post.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BulkToggleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.posts = Post.objects.bulk_create([
+            Post(title=f'Фильм {i}', text='Описание', user=self.user, category=category) for i in range(300)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_likes(self):
+        first, second, third = self.posts[:3]
+        Like.objects.create(post=second, user=self.user)
+        Post.update_counters(second.pk, likes_count=1)
+        response = self.client.post('/api/v1/likes/bulk/',
+                                    {'add': [first.pk, second.pk, 10 ** 6], 'remove': [third.pk]}, format='json')
+        self.assertEqual(response.data, [
+            {'post': first.pk, 'status': 'added'},
+            {'post': second.pk, 'status': 'already_added'},
+            {'post': third.pk, 'status': 'not_added'},
+            {'post': 10 ** 6, 'status': 'not_found'},
+        ])
+        response = self.client.post('/api/v1/likes/bulk/', {'remove': [second.pk]}, format='json')
+        self.assertEqual(response.data, [{'post': second.pk, 'status': 'removed'}])
+        self.assertEqual(set(Like.objects.values_list('post_id', flat=True)), {first.pk})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.likes_count, second.likes_count), (1, 0))
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        ids = [post.pk for post in self.posts]
+        self.client.post('/api/v1/favorites/bulk/', {'add': ids[:5]}, format='json')
+        with self.assertNumQueries(10):
+            self.client.post('/api/v1/favorites/bulk/', {'add': ids[100:], 'remove': ids[:5]}, format='json')
+        self.assertEqual(Favorite.objects.count(), 200)
+        self.assertEqual(Post.objects.filter(favorites_count=1).count(), 200)
+
+    def test_validation(self):
+        response = self.client.post('/api/v1/likes/bulk/', {'add': [1], 'remove': [1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/v1/likes/bulk/', {'add': [1]}, format='json').status_code, 401)
+
+
+class UserPostsListTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        other = User.objects.create_user('other@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        posts = Post.objects.bulk_create([
+            Post(title=f'Фильм {i}', text='Описание', user=self.user, category=category) for i in range(120)
+        ])
+        Favorite.objects.bulk_create([Favorite(post=post, user=self.user) for post in posts])
+        Favorite.objects.create(post=posts[0], user=other)
+        Like.objects.create(post=posts[5], user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_favorites_are_paginated_by_cursor(self):
+        titles, url = [], '/api/v1/favorites/'
+        while url:
+            # страница + select_related поста одним запросом
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            titles += [favorite['post']['title'] for favorite in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(titles, [f'Фильм {i}' for i in reversed(range(120))])
+
+    def test_likes_summary(self):
+        response = self.client.get('/api/v1/likes/')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['post']['title'], 'Фильм 5')
+        self.assertEqual(set(response.data['results'][0]['post']),
+                         {'id', 'title', 'category', 'likes_count', 'rating_average'})
+
+
+@override_settings(NEW_SERIES_CHUNK_SIZE=2)
+class NewSeriesTaskTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@gmail.com', '12345678', is_active=True)
+        self.emails = [f'user{i}@gmail.com' for i in range(5)]
+        for email in self.emails:
+            User.objects.create_user(email, '12345678', is_active=True)
+        User.objects.create_user('inactive@gmail.com', '12345678')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Астрал', text='Описание', user=self.author, category=category)
+
+    def test_fan_out_in_chunks(self):
+        with mock.patch('main_.tasks.send_new_series_chunk.delay') as delay:
+            self.assertEqual(send_new_series(self.post.id), 3)
+        self.assertEqual([call.args for call in delay.call_args_list], [
+            (self.post.id, self.emails[:2]), (self.post.id, self.emails[2:4]), (self.post.id, self.emails[4:]),
+        ])
+
+    def test_chunk_is_idempotent(self):
+        NewSeriesNotification.objects.create(post=self.post, user_id=self.emails[0])
+        self.assertEqual(send_new_series_chunk(self.post.id, self.emails[:2]), 1)
+        self.assertEqual(send_new_series_chunk(self.post.id, self.emails[:2]), 0)
+        self.assertEqual([message.to for message in mail.outbox], [[self.emails[1]]])
+        self.assertIn('Астрал', mail.outbox[0].body)
+
+
+class PostImageVariantsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_FORMATS=['webp', 'jpeg'])
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.admin = User.objects.create_superuser('admin@gmail.com', '12345678')
+        Category.objects.create(name='Ужасы', slug='horror')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def poster(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('poster.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_schedules_processing(self):
+        with mock.patch('main_.signals.process_post_image.delay') as delay, \
+                mock.patch('main_.serializers.send_new_series.delay'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/posts/', {
+                'title': 'Астрал', 'text': 'Описание', 'category': 'horror', 'images': [self.poster(1000, 1500)]
+            })
+        self.assertEqual(response.status_code, 201)
+        delay.assert_called_once_with(PostImage.objects.get().pk)
+
+    def test_variants_and_srcset(self):
+        post = Post.objects.create(title='Астрал', text='Описание', user=self.admin, category_id='horror')
+        post_image = PostImage.objects.create(post=post, image=self.poster(1000, 1500))
+        self.assertEqual(process_post_image(post_image.pk), 6)
+        post_image.refresh_from_db()
+        self.assertEqual({(variant['format'], variant['width']) for variant in post_image.variants},
+                         {(image_format, width) for image_format in ['webp', 'jpeg'] for width in [200, 400, 800]})
+        thumbnail = next(variant for variant in post_image.variants if variant['width'] == 200)
+        with post_image.image.storage.open(thumbnail['name']) as file:
+            self.assertEqual(Image.open(file).size, (200, 300))
+
+        item = self.client.get('/api/v1/posts/').data['results'][0]
+        self.assertTrue(item['thumbnail'].endswith('_200.webp'))
+        self.assertEqual(item['srcset']['webp'].count('w, '), 2)
+        detail = self.client.get(f'/api/v1/posts/{post.id}/').data
+        self.assertIn('800w', detail['images'][0]['srcset']['jpeg'])
+
+    def test_small_images_are_not_upscaled(self):
+        post = Post.objects.create(title='Астрал', text='Описание', user=self.admin, category_id='horror')
+        post_image = PostImage.objects.create(post=post, image=self.poster(300, 200))
+        process_post_image(post_image.pk)
+        post_image.refresh_from_db()
+        self.assertEqual(sorted({variant['width'] for variant in post_image.variants}), [200, 300])
+
+
+class VideoUploadTest(TestCase):
+    def setUp(self):
+        media_root, temp_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, temp_dir)
+        media_settings = override_settings(MEDIA_ROOT=media_root, VIDEO_UPLOAD_TEMP_DIR=temp_dir)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.admin = User.objects.create_superuser('admin@gmail.com', '12345678')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Астрал', text='Описание', user=self.admin, category=category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.content = os.urandom(250_000)
+
+    def start(self, **extra):
+        data = {'post': self.post.id, 'filename': 'trailer.mp4', 'size': len(self.content),
+                'sha256': hashlib.sha256(self.content).hexdigest(), **extra}
+        return self.client.post('/api/v1/uploads/', data).data['id']
+
+    def put_chunk(self, upload_id, start, end, checksum=None):
+        chunk = self.content[start:end]
+        return self.client.put(f'/api/v1/uploads/{upload_id}/', chunk, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.content)}',
+                               HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest())
+
+    def test_chunked_upload_with_resume(self):
+        upload_id = self.start()
+        self.assertEqual(self.put_chunk(upload_id, 0, 100_000).data['received'], 100_000)
+        # повреждённая часть отклоняется, а повтор с другого места - 409 с текущим смещением
+        self.assertEqual(self.put_chunk(upload_id, 100_000, 200_000, checksum='0' * 64).status_code, 400)
+        response = self.put_chunk(upload_id, 150_000, 200_000)
+        self.assertEqual((response.status_code, response.data['received']), (409, 100_000))
+        self.assertEqual(self.client.post(f'/api/v1/uploads/{upload_id}/complete/').status_code, 400)
+
+        self.put_chunk(upload_id, 100_000, 200_000)
+        self.put_chunk(upload_id, 200_000, 250_000)
+        response = self.client.post(f'/api/v1/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 200)
+        video = PostVideo.objects.get(pk=response.data['video'])
+        self.assertEqual(video.post, self.post)
+        with video.video.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(os.path.exists(VideoUpload.objects.get().temp_path))
+
+    def test_whole_file_checksum(self):
+        upload_id = self.start(sha256='0' * 64)
+        self.put_chunk(upload_id, 0, 250_000)
+        self.assertEqual(self.client.post(f'/api/v1/uploads/{upload_id}/complete/').status_code, 400)
+        self.assertFalse(PostVideo.objects.exists())
+
+    def test_filename_without_path(self):
+        for filename in ('../../evil.mp4', 'posts/trailer.mp4', '..'):
+            with self.subTest(filename=filename):
+                response = self.client.post('/api/v1/uploads/', {
+                    'post': self.post.id, 'filename': filename, 'size': len(self.content)})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('filename', response.data)
+        self.assertFalse(VideoUpload.objects.exists())
+        upload_id = self.start(filename='мой трейлер.mp4')
+        self.assertEqual(VideoUpload.objects.get(pk=upload_id).filename, 'мой_трейлер.mp4')
+
+    def test_only_staff_can_upload(self):
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.post('/api/v1/uploads/', {}).status_code, 403)
+
+
+class MediaServingTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        post = Post.objects.create(title='Астрал', text='Описание', user=user, category=category)
+        self.content = bytes(range(256)) * 40
+        self.video = PostVideo.objects.create(post=post, video=SimpleUploadedFile('trailer.mp4', self.content))
+        self.url = f'/media/{self.video.video.name}'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.content))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual((response.status_code, body), (206, self.content[100:200]))
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.get(HTTP_RANGE='bytes=10000-')[1], self.content[10000:])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-5')[1], self.content[-5:])
+        response, _ = self.get(HTTP_RANGE='bytes=999999-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.content)}'))
+
+    def test_if_range_mismatch_sends_full_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertEqual((response.status_code, len(body)), (200, len(self.content)))
+
+    def test_only_published_files(self):
+        with open(os.path.join(settings.MEDIA_ROOT, 'secret.txt'), 'w') as file:
+            file.write('secret')
+        self.assertEqual(self.client.get('/media/secret.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.video.video.name}')
+        self.assertEqual(response.content, b'')
+
+
+class VideoTranscodeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        user = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.post = Post.objects.create(title='Астрал', text='Описание', user=user, category=category)
+        self.video = PostVideo.objects.create(post=self.post, video=SimpleUploadedFile('trailer.mp4', b'video'))
+
+    def fake_run(self, command, **kwargs):
+        if command[0] == 'ffprobe':
+            output = '{"streams": [{"width": 1280, "height": 720}], "format": {"duration": "12.5"}}'
+            return subprocess.CompletedProcess(command, 0, stdout=output, stderr='')
+        # ffmpeg: последний аргумент - выходной файл
+        with open(command[-1], 'w') as file:
+            file.write('#EXTM3U\n')
+        return subprocess.CompletedProcess(command, 0, stdout='', stderr='')
+
+    def test_saving_video_queues_job(self):
+        self.assertEqual(self.video.transcode.status, VideoTranscode.PENDING)
+
+    def test_transcode_ladder(self):
+        with mock.patch('main_.transcoding.subprocess.run', side_effect=self.fake_run) as run:
+            self.assertEqual(transcode_video(self.video.pk), VideoTranscode.DONE)
+        # 1080p выше исходника не кодируем: ffprobe + 3 версии + постер
+        self.assertEqual(run.call_count, 5)
+        job = VideoTranscode.objects.get(video=self.video)
+        self.assertEqual(job.duration, 12.5)
+        self.assertEqual([(r['width'], r['height']) for r in job.renditions], [(1280, 720), (854, 480), (640, 360)])
+        with open(os.path.join(settings.MEDIA_ROOT, job.manifest)) as file:
+            master = file.read()
+        self.assertIn('RESOLUTION=854x480', master)
+        self.assertIn('480p/index.m3u8', master)
+
+        hls = self.client.get(f'/api/v1/posts/{self.post.id}/').data['videos'][0]['hls']
+        self.assertTrue(hls['manifest'].endswith(f'posts/hls/{self.video.pk}/master.m3u8'))
+        self.assertTrue(hls['poster'].endswith('poster.jpg'))
+
+    def test_failed_job(self):
+        error = subprocess.CalledProcessError(1, 'ffprobe', stderr='Invalid data found')
+        with mock.patch('main_.transcoding.subprocess.run', side_effect=error):
+            self.assertEqual(transcode_video(self.video.pk), VideoTranscode.FAILED)
+        self.assertEqual(VideoTranscode.objects.get(video=self.video).error, 'Invalid data found')
+        self.assertIsNone(self.client.get(f'/api/v1/posts/{self.post.id}/').data['videos'][0]['hls'])
+
+
+@override_settings(API_CACHE_TIMEOUT=0)
+class AsyncReadViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.category = Category.objects.create(name='Ужасы', slug='horror')
+        other = Category.objects.create(name='Драма', slug='drama')
+        cls.posts = [
+            Post.objects.create(title=f'Фильм {i}', text='Описание', user=cls.user,
+                                category=cls.category if i % 2 else other)
+            for i in range(5)
+        ]
+        Review.objects.create(post=cls.posts[0], user=cls.user, text='Отзыв', rating=4)
+        Like.objects.create(post=cls.posts[1], user=cls.user)
+        Post.update_counters(cls.posts[1].pk, likes_count=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.async_client = AsyncClient()
+
+    def async_get(self, path, token=None):
+        # AsyncClient в Django 4.0 принимает заголовки в виде имён из ASGI scope
+        return self.async_client.get(path, authorization=f'Token {token or self.token.key}')
+
+    def read_sync(self, path):
+        response = self.client.get(path)
+        # отзывы поста отдаются потоком, он читает из базы при итерации
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    async def assert_same(self, path):
+        response = await self.async_get(f'/api/v1/async{path}')
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(self.read_sync)(f'/api/v1{path}')
+        self.assertEqual(response.json(), json.loads(expected.decode().replace('/api/v1/', '/api/v1/async/')))
+
+    async def test_list_matches_sync_api(self):
+        await self.assert_same('/posts/')
+        await self.assert_same('/posts/?page=2')
+        await self.assert_same('/posts/?category=horror')
+
+    async def test_detail_reviews_and_categories_match_sync_api(self):
+        await self.assert_same(f'/posts/{self.posts[0].pk}/')
+        await self.assert_same(f'/posts/{self.posts[0].pk}/reviews/')
+        await self.assert_same('/categories/')
+
+    async def test_anonymous_and_errors(self):
+        response = await AsyncClient().get('/api/v1/async/posts/')
+        self.assertNotIn('is_liked', response.json()['results'][0])
+        self.assertEqual((await self.async_get('/api/v1/async/posts/', token='wrong')).status_code, 401)
+        self.assertEqual((await self.async_get('/api/v1/async/posts/100500/')).status_code, 404)
+        self.assertEqual((await self.async_get('/api/v1/async/posts/?page=9')).status_code, 404)
+        self.assertEqual((await self.async_client.post('/api/v1/async/categories/')).status_code, 405)
+
+
+@override_settings(TOP_RATED_MIN_REVIEWS=2, TRENDING_HALF_LIFE=3600, TRENDING_DECAY_INTERVAL=3600)
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'user{i}@gmail.com', '12345678', is_active=True) for i in range(3)]
+        self.horror = Category.objects.create(name='Ужасы', slug='horror')
+        drama = Category.objects.create(name='Драма', slug='drama')
+        self.posts = [
+            Post.objects.create(title=f'Фильм {i}', text='Описание', user=self.users[0],
+                                category=self.horror if i < 3 else drama)
+            for i in range(4)
+        ]
+        self.client = APIClient()
+
+    def trending_ids(self):
+        return [post['id'] for post in self.client.get('/api/v1/posts/trending/').data]
+
+    def test_trending_follows_like_and_review_events(self):
+        self.assertEqual(self.trending_ids(), [])
+        for user in self.users:
+            self.client.force_authenticate(user)
+            self.client.post(f'/api/v1/posts/{self.posts[1].id}/like/')
+        self.client.post('/api/v1/reviews/', {'post': self.posts[2].id, 'text': 'Отзыв', 'rating': 5})
+        self.client.post('/api/v1/favorites/bulk/', {'add': [self.posts[3].id]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/posts/{self.posts[1].id}/dislike/')
+        # лайки 1+1, отзыв 3, избранное 2
+        self.assertEqual(self.trending_ids(), [self.posts[2].id, self.posts[3].id, self.posts[1].id])
+        self.assertIn('is_liked', self.client.get('/api/v1/posts/trending/?limit=1').data[0])
+
+    def test_decay_halves_scores_and_drops_tail(self):
+        Post.objects.filter(pk=self.posts[0].pk).update(trending_score=4)
+        Post.objects.filter(pk=self.posts[1].pk).update(trending_score=0.005)
+        self.assertEqual(decay_trending_scores(), 1)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).trending_score, 2)
+        self.assertEqual(Post.objects.get(pk=self.posts[1].pk).trending_score, 0)
+
+    def test_top_rated_in_category(self):
+        ratings = {0: [5], 1: [4, 4], 2: [5, 4], 3: [5, 5]}
+        for index, values in ratings.items():
+            for user, rating in zip(self.users, values):
+                Review.objects.create(post=self.posts[index], user=user, text='Отзыв', rating=rating)
+                Post.update_counters(self.posts[index].pk, reviews_count=1, rating_sum=rating)
+        rebuild_rating_stats()
+        response = self.client.get('/api/v1/categories/horror/top/')
+        # у поста 0 один отзыв, пост 3 из другой категории
+        self.assertEqual([post['id'] for post in response.data], [self.posts[2].id, self.posts[1].id])
+        self.assertEqual(response.data[0]['rating_average'], 4.5)
+        self.assertEqual(self.client.get('/api/v1/categories/comedy/top/').status_code, 404)
+
+
+class RecommendationsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'user{i}@gmail.com', '12345678', is_active=True) for i in range(4)]
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        self.posts = [Post.objects.create(title=f'Фильм {i}', text='Описание', user=self.users[0], category=category)
+                      for i in range(5)]
+        for user, liked, favorited in [(0, [0, 1], []), (1, [0, 1, 2], []), (2, [], [2, 3])]:
+            for index in liked:
+                Like.objects.create(user=self.users[user], post=self.posts[index])
+            for index in favorited:
+                Favorite.objects.create(user=self.users[user], post=self.posts[index])
+        rebuild_recommendations(full=True)
+        self.client = APIClient()
+
+    def similar(self, index):
+        response = self.client.get(f'/api/v1/posts/{self.posts[index].id}/similar/')
+        return [(post['id'], post['title']) for post in response.data]
+
+    def neighbours(self, index):
+        return dict(SimilarPost.objects.filter(post=self.posts[index]).values_list('similar', 'score'))
+
+    def test_cosine_neighbours(self):
+        self.assertEqual(self.neighbours(0), {self.posts[1].id: 1.0, self.posts[2].id: 0.5})
+        self.assertAlmostEqual(self.neighbours(3)[self.posts[2].id], 0.5 ** 0.5, places=5)
+        self.assertEqual([post_id for post_id, _ in self.similar(0)], [self.posts[1].id, self.posts[2].id])
+        self.assertEqual(self.similar(4), [])
+
+    def test_incremental_rebuild(self):
+        Like.objects.create(user=self.users[3], post=self.posts[3])
+        Like.objects.create(user=self.users[3], post=self.posts[4])
+        Like.objects.filter(user=self.users[1], post=self.posts[2]).delete()
+        # изменившиеся 2, 3, 4 и их соседи 0, 1
+        self.assertEqual(rebuild_recommendations(), 5)
+        self.assertEqual(self.neighbours(0), {self.posts[1].id: 1.0})
+        self.assertEqual(set(self.neighbours(4)), {self.posts[3].id})
+        self.assertEqual(rebuild_recommendations(), 0)
+
+    def test_user_recommendations(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.get('/api/v1/recommendations/')
+        self.assertEqual([post['id'] for post in response.data], [self.posts[2].id])
+        self.assertFalse(response.data[0]['is_liked'])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/v1/recommendations/').status_code, 401)
+
+
+@override_settings(RATING_PRIOR_WEIGHT=5, TOP_RATED_MIN_REVIEWS=1)
+class RatingStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        users = [User.objects.create_user(f'user{i}@gmail.com', '12345678', is_active=True) for i in range(6)]
+        horror = Category.objects.create(name='Ужасы', slug='horror')
+        drama = Category.objects.create(name='Драма', slug='drama')
+        self.posts = {}
+        for name, category, ratings in [('single', horror, [5]), ('many', horror, [5, 5, 5, 4, 4, 4]),
+                                        ('none', horror, []), ('drama', drama, [1, 2])]:
+            post = Post.objects.create(title=name, text='Описание', user=users[0], category=category)
+            for user, rating in zip(users, ratings):
+                Review.objects.create(post=post, user=user, text='Отзыв', rating=rating)
+                Post.update_counters(post.pk, reviews_count=1, rating_sum=rating)
+            self.posts[name] = post
+        self.client = APIClient()
+
+    def test_bayesian_average_and_percentiles(self):
+        self.assertEqual(rebuild_rating_stats(), 4)
+        self.assertEqual(rebuild_rating_stats(), 0)
+        prior = 35 / 9
+        single = Post.objects.get(pk=self.posts['single'].pk)
+        many = Post.objects.get(pk=self.posts['many'].pk)
+        self.assertAlmostEqual(single.bayesian_average, (prior * 5 + 5) / 6, places=2)
+        self.assertAlmostEqual(many.bayesian_average, (prior * 5 + 27) / 11, places=2)
+        # один отзыв на 5 не обгоняет шесть отзывов со средним 4.5
+        self.assertEqual((single.rating_percentile, many.rating_percentile), (25.0, 75.0))
+        self.assertIsNone(Post.objects.get(pk=self.posts['none'].pk).rating_percentile)
+        self.assertEqual(Post.objects.get(pk=self.posts['drama'].pk).rating_percentile, 50.0)
+        response = self.client.get('/api/v1/categories/horror/top/')
+        self.assertEqual([post['title'] for post in response.data], ['many', 'single'])
+
+    def test_stats_only_on_detail_after_rebuild(self):
+        url = f'/api/v1/posts/{self.posts["single"].id}/'
+        detail = self.client.get(url).data
+        self.assertEqual(detail['rating_average'], 5.0)
+        self.assertNotIn('bayesian_average', detail)
+        self.assertIsNone(self.client.get(f'{url}rating_stats/').data['bayesian_average'])
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_rating_stats()
+        self.assertIn('bayesian_average', self.client.get(url).data)
+        for post in self.client.get('/api/v1/posts/').data['results']:
+            self.assertNotIn('bayesian_average', post)
+            self.assertNotIn('rating_histogram', post)
+
+    def test_rating_stats_endpoint(self):
+        rebuild_rating_stats()
+        response = self.client.get(f'/api/v1/posts/{self.posts["many"].id}/rating_stats/')
+        self.assertEqual(response.data['histogram'], {'1': 0, '2': 0, '3': 0, '4': 3, '5': 3})
+        self.assertEqual(response.data['rating_average'], 4.5)
+        self.assertEqual(response.data['category_percentile'], 75.0)
+        self.assertEqual(set(response.data['category_percentiles']), {'25', '50', '75', '90'})
+        detail = self.client.get(f'/api/v1/posts/{self.posts["single"].id}/').data
+        self.assertEqual(detail['rating_histogram'], [0, 0, 0, 0, 1])
+        self.assertEqual(detail['bayesian_average'], 4.1)
+        self.assertNotIn('rating_percentiles', self.client.get('/api/v1/categories/').data['results'][0])
+
+
+    def test_category_percentiles_refresh_cached_stats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_rating_stats()
+        Category.objects.filter(slug='drama').update(rating_percentiles={})
+        url = f'/api/v1/posts/{self.posts["drama"].id}/rating_stats/'
+        response = self.client.get(url)
+        self.assertEqual(response.data['category_percentiles'], {})
+        # сами посты не изменились, поменялись только перцентили категории
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebuild_rating_stats(), 0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['category_percentiles']), {'25', '50', '75', '90'})
+
+
+class CatalogueImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ('MEDIA_ROOT', 'SOURCE_ROOT'):
+            path = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, path)
+            setattr(self, name.lower(), path)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        os.makedirs(os.path.join(self.source_root, 'posts'))
+        with open(os.path.join(self.source_root, 'posts', 'aot.jpg'), 'wb') as file:
+            file.write(b'image')
+        self.author = User.objects.create_user('author@gmail.com', '12345678', is_active=True)
+        self.reviewer = User.objects.create_user('user@gmail.com', '12345678', is_active=True)
+        Category.objects.create(name='Ужасы', slug='horror')
+
+    def write_catalogue(self, rows):
+        path = os.path.join(self.source_root, 'catalogue.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            for row in rows:
+                file.write(row if isinstance(row, str) else json.dumps(row, ensure_ascii=False))
+                file.write('\n')
+        return path
+
+    def import_catalogue(self, path, *args):
+        out, err = StringIO(), StringIO()
+        with mock.patch('main_.catalogue.process_post_image.delay') as process, \
+                mock.patch('main_.catalogue.transcode_video.delay'), \
+                mock.patch('main_.catalogue.send_new_series.delay') as new_series, \
+                mock.patch('main_.management.commands.import_catalogue.send_catalogue_digest.delay') as digest, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalogue', path, '--media-root', self.source_root, '--batch-size', '2',
+                         *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue(), process, new_series, digest
+
+    def test_paths_outside_media_root(self):
+        secret = os.path.join(os.path.dirname(self.source_root), 'secret.txt')
+        with open(secret, 'w') as file:
+            file.write('secret')
+        self.addCleanup(os.remove, secret)
+        path = self.write_catalogue([
+            {'title': 'Атака титанов', 'text': 'Гиганты', 'category': 'horror', 'user': 'author@gmail.com',
+             'images': ['../secret.txt', secret, 'posts/aot.jpg'], 'videos': ['posts/../../secret.txt']},
+        ])
+        out, err, *_ = self.import_catalogue(path)
+        self.assertIn('Создано постов: 1', out)
+        self.assertIn('путь ../secret.txt вне --media-root', err)
+        self.assertIn(f'путь {secret} вне --media-root', err)
+        self.assertIn('путь posts/../../secret.txt вне --media-root', err)
+        post = Post.objects.get()
+        self.assertEqual(post.pics.count(), 1)
+        self.assertFalse(post.trailer.exists())
+        for root, _, files in os.walk(self.media_root):
+            for name in files:
+                with open(os.path.join(root, name), 'rb') as file:
+                    self.assertNotEqual(file.read(), b'secret')
+
+    def test_import_with_digest(self):
+        path = self.write_catalogue([
+            {'title': 'Атака титанов', 'text': 'Гиганты', 'category': 'horror', 'user': 'author@gmail.com',
+             'images': ['posts/aot.jpg', 'posts/missing.jpg'],
+             'reviews': [{'user': 'user@gmail.com', 'text': 'Отзыв', 'rating': 4},
+                         {'user': 'ghost@gmail.com', 'text': 'Отзыв', 'rating': 1}]},
+            {'title': 'Астрал', 'text': 'Описание', 'category': 'horror'},
+            {'title': 'Без категории', 'text': 'Описание', 'category': 'comedy'},
+            'не json',
+            {'title': 'Оно', 'text': 'Клоун', 'category': 'horror'},
+        ])
+        out, err, process, new_series, digest = self.import_catalogue(path, '--user', 'author@gmail.com', '--digest')
+        self.assertIn('Создано постов: 3, пропущено строк: 2', out)
+        self.assertIn('Строка 3: неизвестная категория comedy', err)
+        self.assertIn('файл posts/missing.jpg не найден', err)
+
+        post = Post.objects.get(title='Атака титанов')
+        self.assertEqual((post.reviews_count, post.rating_sum, post.rating_average), (1, 4, 4))
+        image = post.pics.get()
+        with open(os.path.join(self.media_root, image.image.name), 'rb') as file:
+            self.assertEqual(file.read(), b'image')
+        process.assert_called_once_with(image.pk)
+        new_series.assert_not_called()
+        digest.assert_called_once_with(sorted(Post.objects.values_list('pk', flat=True)))
+        # поиск находит импортированные посты без сигналов post_save
+        response = self.client.get('/api/v1/posts/search/', {'q': 'клоун'})
+        self.assertEqual([post['title'] for post in response.data['results']], ['Оно'])
+
+    def test_notifies_per_post_without_digest(self):
+        path = self.write_catalogue([{'title': 'Оно', 'text': 'Клоун', 'category': 'horror'}])
+        out, err, *_ = self.import_catalogue(path)
+        self.assertIn('пропущено строк: 1', out)
+        self.assertIn('Строка 1: нет автора', err)
+        with self.assertRaises(CommandError):
+            self.import_catalogue(path, '--user', 'nobody@gmail.com')
+        _, _, _, new_series, digest = self.import_catalogue(path, '--user', 'author@gmail.com')
+        new_series.assert_called_once_with(Post.objects.get().pk)
+        digest.assert_not_called()
+
+    def test_export_round_trip(self):
+        path = self.write_catalogue([
+            {'title': 'Атака титанов', 'text': 'Гиганты', 'category': 'horror', 'user': 'author@gmail.com',
+             'images': ['posts/aot.jpg'], 'videos': [],
+             'reviews': [{'user': 'user@gmail.com', 'text': 'Отзыв', 'rating': 4}]},
+        ])
+        self.import_catalogue(path)
+        out = StringIO()
+        call_command('export_catalogue', '-', stdout=out)
+        exported = json.loads(out.getvalue())
+        self.assertEqual(exported['title'], 'Атака титанов')
+        self.assertEqual(exported['reviews'], [{'user': 'user@gmail.com', 'text': 'Отзыв', 'rating': 4}])
+        self.assertEqual(exported['images'], [Post.objects.get().pics.get().image.name])
+
+    @override_settings(NEW_SERIES_CHUNK_SIZE=1)
+    def test_digest_mail(self):
+        posts = [Post.objects.create(title=f'Фильм {i}', text='Описание', user=self.author, category_id='horror')
+                 for i in range(3)]
+        with mock.patch('main_.tasks.send_digest_chunk.delay') as delay, \
+                override_settings(CATALOGUE_DIGEST_TITLES=2):
+            self.assertEqual(send_catalogue_digest([post.pk for post in posts]), 2)
+        body, emails = delay.call_args_list[0].args
+        self.assertEqual(emails, ['author@gmail.com'])
+        self.assertIn('- Фильм 1', body)
+        self.assertIn('и ещё 1', body)
+
+
+class BenchmarkTest(TestCase):
+    def test_seed_run_and_budgets(self):
+        posts = benchmark.seed(users=3, posts=10, likes=2)
+        self.assertEqual(Post.objects.filter(reviews_count=3).count(), 10)
+        results = benchmark.run(posts, iterations=2, only=['posts-list', 'posts-like-toggle'])
+        self.assertEqual(set(results), {'posts-list', 'posts-like-toggle'})
+        self.assertEqual(results['posts-list']['status'], 200)
+        self.assertGreater(results['posts-list']['peak_kb'], 0)
+        budgets = {'posts-list': {'queries': results['posts-list']['queries'] - 1}}
+        self.assertEqual(benchmark.check_budgets(results, budgets), [
+            f'posts-list: queries {results["posts-list"]["queries"]} > {results["posts-list"]["queries"] - 1}'
+        ])
+
+    def test_serializer_throughput(self):
+        benchmark.seed(users=2, posts=5, likes=1)
+        results = benchmark.serializer_throughput(rows=5, repeat=1)
+        self.assertEqual(set(results), {'post-list', 'post-list-read', 'post-detail', 'post-detail-read'})
+        self.assertTrue(all(rows > 0 for rows in results.values()))
+
+    def test_budgets_cover_all_scenarios(self):
+        budgets = benchmark.load_budgets(os.path.join(os.path.dirname(benchmark.__file__), 'benchmark_budgets.json'))
+        self.assertEqual(set(budgets), {name for name, _, _ in benchmark.scenarios([Post(pk=1)])})
+
+
+@override_settings(API_CACHE_TIMEOUT=0, INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_METRICS_TOKEN='scrape-secret')
+class InstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        Post.objects.bulk_create([
+            Post(title=f'Фильм {i}', text='Описание', user=cls.user, category=category) for i in range(3)
+        ])
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/v1/posts/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", ser;dur=[\d.]+$')
+        self.client.get('/api/v1/likes/')
+
+        stats = instrumentation.registry.snapshot()
+        self.assertEqual(set(stats), {'PostViewSet.list', 'LikesListView.get'})
+        self.assertEqual(stats['PostViewSet.list'].response_bytes, len(response.content))
+        self.assertGreater(stats['PostViewSet.list'].serializer_ms, 0)
+
+        metrics = self.client.get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(metrics.status_code, 200)
+        text = metrics.content.decode()
+        self.assertIn('api_request_duration_ms_count{endpoint="PostViewSet.list"} 1', text)
+        self.assertIn('api_request_duration_ms_bucket{endpoint="LikesListView.get",le="+Inf"} 1', text)
+        self.assertIn('api_sampled_requests_total{endpoint="PostViewSet.list"} 1', text)
+
+    def test_metrics_closed_for_others(self):
+        # за обратным прокси все запросы приходят с 127.0.0.1
+        self.assertEqual(self.client.get('/api/v1/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        with override_settings(INSTRUMENTATION_METRICS_TOKEN=''):
+            self.assertEqual(client.get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, 200)
+
+    async def test_async_requests_stay_in_event_loop(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+        self.assertTrue(asyncio.iscoroutinefunction(instrumentation.InstrumentationMiddleware(get_response)))
+        self.assertFalse(asyncio.iscoroutinefunction(instrumentation.InstrumentationMiddleware(lambda r: r)))
+
+        response = await AsyncClient().get('/api/v1/async/categories/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, ser;dur=[\d.]+$')
+        self.assertIn('category_list', instrumentation.registry.snapshot())
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_only_count_time(self):
+        response = self.client.get('/api/v1/posts/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+        stats = instrumentation.registry.snapshot()['PostViewSet.list']
+        self.assertEqual((stats.count, stats.sampled, stats.queries), (1, 0, 0))
+
+    def test_duplicate_queries(self):
+        self.assertEqual(instrumentation.fingerprint("SELECT * FROM t WHERE id = 15 AND name = 'a''b'"),
+                         'SELECT * FROM t WHERE id = ? AND name = ?')
+        self.assertEqual(instrumentation.fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)'),
+                         'SELECT * FROM t WHERE id IN (...)')
+        sample = instrumentation.Sample()
+        with connection.execute_wrapper(sample):
+            for post in Post.objects.all():
+                post.user.name
+        self.assertEqual(sample.queries, 4)
+        self.assertEqual(list(sample.duplicates().values()), [3])
+
+
+@override_settings(API_CACHE_TIMEOUT=0)
+class SerializerProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff@gmail.com', '12345678', is_active=True, name='Staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        for i in range(3):
+            post = Post.objects.create(title=f'Фильм {i}', text='Описание', user=cls.user, category=category)
+            Review.objects.create(post=post, user=cls.user, text='Отзыв', rating=4)
+            Like.objects.create(post=post, user=cls.staff)
+
+    def setUp(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir)
+        profile_settings = override_settings(SERIALIZER_PROFILE_DIR=profile_dir)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        profiling.field_stats.reset()
+        self.client = APIClient()
+
+    def test_staff_cprofile(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/v1/posts/?profile=cprofile')
+        self.assertTrue(response['X-Profile'].endswith('-PostViewSet.list.prof'))
+        stats = pstats.Stats(os.path.join(settings.SERIALIZER_PROFILE_DIR, response['X-Profile']))
+        self.assertIn('to_representation', {function for _, _, function in stats.stats})
+
+        # у PostListReadSerializer нет полей DRF - поля видны только у ModelSerializer
+        self.assertEqual(profiling.field_stats.snapshot(), {})
+
+    def test_field_timings(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/v1/likes/', HTTP_X_PROFILE='cprofile')
+        self.assertTrue(response['X-Profile'].endswith('-LikesListView.get.prof'))
+        fields = profiling.field_stats.snapshot()
+        self.assertEqual(set(fields), {'LikesListSerializer.id', 'LikesListSerializer.post'})
+        self.assertEqual(fields['LikesListSerializer.post'][0], 3)
+        self.assertIn('api_serializer_field_calls_total{field="LikesListSerializer.post"} 3',
+                      instrumentation.prometheus_text())
+
+    def test_staff_stack_samples(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(f'/api/v1/posts/{Post.objects.first().pk}/', HTTP_X_PROFILE='stack')
+        self.assertTrue(response['X-Profile'].endswith('-PostViewSet.retrieve.folded'))
+        self.assertTrue(os.path.isfile(os.path.join(settings.SERIALIZER_PROFILE_DIR, response['X-Profile'])))
+
+    def test_not_for_regular_users(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/posts/', HTTP_X_PROFILE='cprofile')
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(os.listdir(settings.SERIALIZER_PROFILE_DIR), [])
+
+    @override_settings(SERIALIZER_PROFILE_SAMPLE_RATE=1, SERIALIZER_PROFILE_KEEP=2)
+    def test_sampling_keeps_last_profiles(self):
+        self.client.force_authenticate(self.staff)
+        for _ in range(3):
+            self.client.get('/api/v1/likes/')
+        self.assertEqual(len(os.listdir(settings.SERIALIZER_PROFILE_DIR)), 2)
+        self.assertEqual(profiling.field_stats.snapshot()['LikesListSerializer.id'][0], 9)
+
+
+class ReadSerializersParityTest(TestCase):
+    """Быстрые сериализаторы для чтения должны отдавать ровно то же, что ModelSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        cls.posts = [Post.objects.create(title=f'Фильм {i}', text='Описание', user=cls.user, category=category)
+                     for i in range(4)]
+        with_media = cls.posts[0]
+        image = PostImage.objects.create(post=with_media, image='posts/aot.jpg')
+        # варианты при сохранении картинки сбрасываются сигналом, пишем их в обход
+        PostImage.objects.filter(pk=image.pk).update(variants=[
+            {'format': 'webp', 'width': 200, 'name': 'posts/variants/a_200.webp'},
+            {'format': 'jpeg', 'width': 200, 'name': 'posts/variants/a_200.jpg'},
+            {'format': 'webp', 'width': 400, 'name': 'posts/variants/a_400.webp'},
+        ])
+        PostImage.objects.create(post=with_media, image='posts/second.jpg')
+        done = PostVideo.objects.create(post=with_media, video='posts/aot.mp4')
+        VideoTranscode.objects.update_or_create(video=done, defaults={
+            'status': VideoTranscode.DONE, 'manifest': 'posts/hls/aot.m3u8', 'poster': 'posts/hls/aot.jpg',
+            'duration': 12.5,
+        })
+        PostVideo.objects.create(post=with_media, video='posts/other.mp4')
+        # старый трейлер без записи о транскодировании
+        VideoTranscode.objects.filter(
+            video=PostVideo.objects.create(post=with_media, video='posts/raw.mp4')).delete()
+        for rating in (5, 3):
+            Review.objects.create(post=with_media, user=cls.user, text=f'Отзыв {rating}', rating=rating)
+        Review.objects.create(post=cls.posts[1], user=cls.user, text='Отзыв', rating=1)
+        Like.objects.create(post=cls.posts[1], user=cls.user)
+        Favorite.objects.create(post=cls.posts[2], user=cls.user)
+        call_command('rebuild_post_counters', stdout=StringIO())
+        rebuild_rating_stats()
+
+    def context(self, user):
+        request = RequestFactory().get('/api/v1/posts/')
+        request.user = user
+        return {'request': request}
+
+    def render(self, data):
+        # сравниваем итоговый JSON, в т.ч. порядок ключей
+        return JSONRenderer().render(data)
+
+    def test_post_list(self):
+        for user in (self.user, AnonymousUser()):
+            posts = list(annotate_post_list(Post.objects.order_by('pk'), user))
+            context = self.context(user)
+            self.assertEqual(self.render(PostListReadSerializer(posts, many=True, context=context).data),
+                             self.render(PostListSerializer(posts, many=True, context=context).data))
+
+    def test_post_detail(self):
+        for user in (self.user, AnonymousUser()):
+            context = self.context(user)
+            for post in Post.objects.order_by('pk'):
+                self.assertEqual(self.render(PostReadSerializer(post, context=context).data),
+                                 self.render(PostSerializer(post, context=context).data))
+        data = PostReadSerializer(self.posts[0], context=self.context(self.user)).data
+        self.assertEqual([video['hls'] and video['hls']['duration'] for video in data['videos']], [12.5, None, None])
+        self.assertIn('webp', data['images'][0]['srcset'])
+
+    def test_reviews(self):
+        reviews = Review.objects.filter(post=self.posts[0])
+        self.assertEqual(self.render(review_rows(reviews)), self.render(ReviewSerializer(reviews, many=True).data))
+
+    def test_detail_reads_reviews_once(self):
+        context = self.context(self.user)
+        post = Post.objects.get(pk=self.posts[0].pk)
+        # отзывы + картинки + видео + лайк + избранное
+        with self.assertNumQueries(5):
+            PostReadSerializer(post, context=context).data
+
+
+class RenderersTest(TestCase):
+    def test_same_output_as_json_renderer(self):
+        data = ReturnList([OrderedDict([
+            ('title', 'Атака титанов\u2028'), ('price', Decimal('1.50')), ('lazy', gettext_lazy('Описание')),
+            ('created_at', datetime(2022, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc)),
+            ('histogram', {1: 0, 5: 2}), ('empty', None),
+        ])], serializer=None)
+        expected = JSONRenderer().render(data)
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        with mock.patch('main_.renderers.orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        self.assertEqual(renderers.FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+    @override_settings(STREAMING_JSON_CHUNK=2)
+    def test_stream_json_list(self):
+        chunks = list(renderers.stream_json_list({'id': i} for i in range(5)))
+        self.assertEqual(chunks, [b'[', b'{"id":0},{"id":1}', b',{"id":2},{"id":3}', b',{"id":4}', b']'])
+        self.assertEqual(b''.join(renderers.stream_json_list([])), b'[]')
+
+
+@override_settings(STREAMING_JSON_CHUNK=2)
+class StreamingResponsesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@gmail.com', '12345678', is_active=True, name='User')
+        cls.staff = User.objects.create_user('staff@gmail.com', '12345678', is_active=True, is_staff=True)
+        category = Category.objects.create(name='Ужасы', slug='horror')
+        cls.post = Post.objects.create(title='Фильм', text='Описание', user=cls.user, category=category)
+        Review.objects.bulk_create([Review(post=cls.post, user=cls.user, text=f'Отзыв {i}', rating=i % 5 + 1)
+                                    for i in range(5)])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_reviews(self):
+        response = self.client.get(f'/api/v1/posts/{self.post.pk}/reviews/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(self.content(response),
+                         json.loads(JSONRenderer().render(ReviewSerializer(self.post.reviews.all(), many=True).data)))
+
+    def test_export_for_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/posts/export/').status_code, 403)
+        self.client.force_authenticate(self.staff)
+        exported = self.content(self.client.get('/api/v1/posts/export/'))
+        self.assertEqual([post['title'] for post in exported], ['Фильм'])
+        self.assertEqual(len(exported[0]['reviews']), 5)
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+
+def probe(path):
+    """(ширина, высота, длительность в секундах) исходного видео."""
+    output = subprocess.run(
+        [settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height:format=duration', '-of', 'json', path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    info = json.loads(output)
+    stream = info['streams'][0]
+    return stream['width'], stream['height'], float(info['format']['duration'])
+
+
+def ladder(width, height):
+    renditions = []
+    for target_height, bitrate in settings.VIDEO_HLS_LADDER:
+        if target_height > height:
+            continue
+        # ширина чётная, как требует libx264
+        target_width = round(width * target_height / height / 2) * 2
+        renditions.append({'height': target_height, 'width': target_width, 'bitrate': bitrate})
+    if not renditions:
+        # исходник меньше всей лесенки - одна версия в родном размере
+        renditions.append({'height': height - height % 2, 'width': width - width % 2,
+                           'bitrate': settings.VIDEO_HLS_LADDER[-1][1]})
+    return renditions
+
+
+def encode_rendition(source, output_dir, rendition):
+    directory = os.path.join(output_dir, f'{rendition["height"]}p')
+    os.makedirs(directory, exist_ok=True)
+    bitrate = rendition['bitrate']
+    subprocess.run(
+        [settings.FFMPEG_BINARY, '-y', '-v', 'error', '-i', source,
+         '-map', '0:v:0', '-map', '0:a:0?',
+         '-vf', f'scale={rendition["width"]}:{rendition["height"]}',
+         '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+         '-b:v', f'{bitrate}k', '-maxrate', f'{int(bitrate * 1.07)}k', '-bufsize', f'{bitrate * 2}k',
+         '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+         '-hls_time', str(settings.VIDEO_HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+         '-hls_segment_filename', os.path.join(directory, 'segment_%04d.ts'),
+         os.path.join(directory, 'index.m3u8')],
+        check=True, capture_output=True, text=True
+    )
+    return f'{rendition["height"]}p/index.m3u8'
+
+
+def extract_poster(source, output_dir, duration):
+    path = os.path.join(output_dir, 'poster.jpg')
+    subprocess.run(
+        [settings.FFMPEG_BINARY, '-y', '-v', 'error', '-ss', f'{min(1.0, duration / 2):.2f}', '-i', source,
+         '-frames:v', '1', '-q:v', '3', path],
+        check=True, capture_output=True, text=True
+    )
+
+
+def write_master(output_dir, renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for rendition in renditions:
+        # + 128 кбит/с звука
+        bandwidth = (rendition['bitrate'] + 128) * 1000
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={rendition["width"]}x{rendition["height"]}')
+        lines.append(rendition['playlist'])
+    with open(os.path.join(output_dir, 'master.m3u8'), 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def transcode(post_video):
+    """Кодирует трейлер в HLS и возвращает поля для VideoTranscode."""
+    source = post_video.video.path
+    name = f'posts/hls/{post_video.pk}'
+    output_dir = default_storage.path(name)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    width, height, duration = probe(source)
+    renditions = ladder(width, height)
+    # версии кодируются параллельно, но не больше VIDEO_TRANSCODE_WORKERS ffmpeg сразу
+    with ThreadPoolExecutor(max_workers=settings.VIDEO_TRANSCODE_WORKERS) as executor:
+        playlists = list(executor.map(lambda rendition: encode_rendition(source, output_dir, rendition),
+                                      renditions))
+    for rendition, playlist in zip(renditions, playlists):
+        rendition['playlist'] = playlist
+    extract_poster(source, output_dir, duration)
+    write_master(output_dir, renditions)
+    return {
+        'manifest': f'{name}/master.m3u8',
+        'poster': f'{name}/poster.jpg',
+        'duration': duration,
+        'renditions': [{**rendition, 'playlist': f'{name}/{rendition["playlist"]}'} for rendition in renditions],
+    }
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from rest_framework import serializers
+
+from main_.models import PostVideo
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+COPY_BUFFER = 64 * 1024
+
+
+class StagedFile(File):
+    # FileSystemStorage перемещает такой файл вместо копирования
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def parse_content_range(header, upload):
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise serializers.ValidationError('Нужен заголовок Content-Range: bytes start-end/size')
+    start, end, total = map(int, match.groups())
+    if total != upload.size or start > end or end >= total:
+        raise serializers.ValidationError('Некорректный Content-Range')
+    if end - start + 1 > settings.VIDEO_UPLOAD_MAX_CHUNK:
+        raise serializers.ValidationError('Слишком большая часть файла')
+    return start, end - start + 1
+
+
+def write_chunk(upload, stream, start, length, sha256):
+    """Пишет часть из тела запроса в файл по смещению start, не держа её в памяти целиком."""
+    os.makedirs(settings.VIDEO_UPLOAD_TEMP_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd = os.open(upload.temp_path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, 'r+b') as file:
+        # хвост от оборванной прошлой попытки отбрасываем
+        file.truncate(start)
+        file.seek(start)
+        remaining = length
+        while remaining and stream is not None:
+            data = stream.read(min(COPY_BUFFER, remaining))
+            if not data:
+                break
+            digest.update(data)
+            file.write(data)
+            remaining -= len(data)
+        if remaining or digest.hexdigest() != sha256.lower():
+            file.truncate(start)
+            raise serializers.ValidationError('Часть файла повреждена или получена не полностью')
+    upload.received = start + length
+    upload.save(update_fields=['received'])
+
+
+def complete_upload(upload):
+    if upload.received != upload.size:
+        raise serializers.ValidationError(f'Получено {upload.received} из {upload.size} байт')
+    if upload.sha256:
+        digest = hashlib.sha256()
+        with open(upload.temp_path, 'rb') as file:
+            for data in iter(lambda: file.read(COPY_BUFFER), b''):
+                digest.update(data)
+        if digest.hexdigest() != upload.sha256.lower():
+            raise serializers.ValidationError('Контрольная сумма файла не совпадает')
+    video = PostVideo(post_id=upload.post_id)
+    staged = StagedFile(upload.temp_path, upload.filename)
+    try:
+        video.video.save(upload.filename, staged, save=True)
+    finally:
+        staged.close()
+    if os.path.exists(upload.temp_path):
+        os.remove(upload.temp_path)
+    upload.video = video
+    upload.save(update_fields=['video'])
+    return video
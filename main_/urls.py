@@ -1,15 +1,27 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from main_.views import PostViewSet, CategoryViewSet, FavoritesListView, LikesListView, ReviewViewSet
+from main_ import async_views, instrumentation
+from main_.views import PostViewSet, CategoryViewSet, FavoritesListView, LikesListView, ReviewViewSet, \
+    LikesBulkView, FavoritesBulkView, VideoUploadViewSet, RecommendationsView
 
 router = DefaultRouter()
 router.register('posts', PostViewSet)
 router.register('reviews', ReviewViewSet)
 router.register('categories', CategoryViewSet)
+router.register('uploads', VideoUploadViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('favorites/', FavoritesListView.as_view()),
-    path('likes/', LikesListView.as_view())
+    path('likes/', LikesListView.as_view()),
+    path('favorites/bulk/', FavoritesBulkView.as_view()),
+    path('likes/bulk/', LikesBulkView.as_view()),
+    path('recommendations/', RecommendationsView.as_view()),
+    path('metrics/', instrumentation.MetricsView.as_view()),
+    # те же данные без DRF, для ASGI
+    path('async/posts/', async_views.post_list),
+    path('async/posts/<int:pk>/', async_views.post_detail),
+    path('async/posts/<int:pk>/reviews/', async_views.post_reviews),
+    path('async/categories/', async_views.category_list),
 ]
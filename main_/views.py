@@ -1,16 +1,67 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.generics import ListAPIView
-from rest_framework.mixins import CreateModelMixin, UpdateModelMixin, DestroyModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import ListAPIView, get_object_or_404
+from rest_framework.mixins import CreateModelMixin, UpdateModelMixin, DestroyModelMixin, RetrieveModelMixin
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from main_.models import Category, Post, Favorite, Review, Like
+from main_.models import Category, Post, PostImage, PostVideo, Favorite, Review, Like, VideoUpload
+from main_.cache import cached_response
+from main_.catalogue import export_posts
+from main_ import leaderboards, recommendations
+from main_.rating_stats import post_rating_stats
+from main_.instrumentation import InstrumentedViewMixin
+from main_.conditional import post_conditional, post_stats_conditional, posts_conditional, \
+    categories_conditional
+from main_.pagination import PostCursorPagination, UserPostsCursorPagination
 from main_.permissions import IsAuthor, IsAdmin
-from main_.serializers import CategorySerializer, PostSerializer, PostListSerializer, \
-    FavoritesListSerializer, LikesListSerializer, ReviewSerializer
+from main_.renderers import streaming_json_response
+from main_.search import IndexSearchFilter, search_posts, highlight
+from main_.signals import batched_post_changes
+from main_.uploads import parse_content_range, write_chunk, complete_upload
+from main_.serializers import CategorySerializer, PostSerializer, PostListReadSerializer, PostReadSerializer, \
+    FavoritesListSerializer, LikesListSerializer, ReviewSerializer, BulkToggleSerializer, VideoUploadSerializer, \
+    iter_review_rows
+
+
+# поля Favorite/Like + поста, нужные PostSummarySerializer
+SUMMARY_FIELDS = ['id', 'user', 'post__id', 'post__title', 'post__category', 'post__likes_count',
+                  'post__rating_average', 'post__reviews_count']
+
+
+def annotate_post_list(queryset, user):
+    # всё, что нужно PostListReadSerializer, считаем в одном запросе,
+    # чтобы число запросов не зависело от размера страницы;
+    # likes_count и рейтинг берутся из счётчиков Post
+    first_image = PostImage.objects.filter(post=OuterRef('pk')).order_by('id')
+    first_video = PostVideo.objects.filter(post=OuterRef('pk')).order_by('id').values('video')[:1]
+    queryset = queryset.select_related('user').prefetch_related(
+        Prefetch('reviews', queryset=Review.objects.only('id', 'post'))
+    ).annotate(
+        first_image=Subquery(first_image.values('image')[:1]),
+        first_image_variants=Subquery(first_image.values('variants')[:1]),
+        first_video=Subquery(first_video),
+    )
+    if user.is_authenticated:
+        queryset = queryset.annotate(
+            is_liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)),
+            is_favorited=Exists(Favorite.objects.filter(post=OuterRef('pk'), user=user)),
+        )
+    return queryset
+
+
+def posts_in_order(request, ids):
+    posts = annotate_post_list(Post.objects.all(), request.user).in_bulk(ids)
+    posts = [posts[post_id] for post_id in ids if post_id in posts]
+    return PostListReadSerializer(posts, many=True, context={'request': request}).data
 
 
 # class CategoriesListView(ListAPIView):
@@ -18,23 +69,70 @@ from main_.serializers import CategorySerializer, PostSerializer, PostListSerial
 #     serializer_class = CategorySerializer
 
 
-class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.all()
+class CategoryViewSet(InstrumentedViewMixin, ModelViewSet):
+    queryset = Category.objects.order_by('slug')
     serializer_class = CategorySerializer
     permission_classes = [IsAdmin]
 
+    @categories_conditional
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, ['categories'], partial(super().list, request, *args, **kwargs))
 
-class PostViewSet(ModelViewSet):
+    # api/v1/categories/slug/top/
+    @action(['GET'], detail=True)
+    def top(self, request, pk=None):
+        category = self.get_object()
+
+        def get_response():
+            posts = leaderboards.top_rated(annotate_post_list(Post.objects.all(), request.user), category,
+                                           leaderboards.limit_from(request))
+            return Response(PostListReadSerializer(posts, many=True, context={'request': request}).data)
+        return cached_response(request, ['posts'], get_response, user_flags=True)
+
+
+class PostViewSet(InstrumentedViewMixin, ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexSearchFilter, OrderingFilter]
     search_fields = ['title', 'text']
     filterset_fields = ['category']
+    ordering_fields = ['rating_average', 'likes_count', 'created_at', 'title']
+    ordering = ['-created_at']
+
+    @property
+    def paginator(self):
+        # ?ordering=... отдаём курсорными страницами
+        if not hasattr(self, '_paginator') and getattr(self, 'action', None) == 'list' \
+                and 'ordering' in self.request.query_params:
+            self._paginator = PostCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'search', 'trending']:
+            queryset = self.annotate_list(queryset)
+        return queryset
+
+    def annotate_list(self, queryset):
+        return annotate_post_list(queryset, self.request.user)
+
+    @posts_conditional
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, ['posts'], partial(super().list, request, *args, **kwargs),
+                               user_flags=True)
+
+    @post_conditional
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, [f'post:{kwargs["pk"]}'], partial(super().retrieve, request, *args, **kwargs),
+                               user_flags=True)
 
     def get_serializer_class(self):
         serializer_class = super().get_serializer_class()
-        if self.action == 'list':
-            serializer_class = PostListSerializer
+        # на чтение - быстрые сериализаторы, PostSerializer остаётся для записи
+        if self.action in ['list', 'search', 'trending']:
+            serializer_class = PostListReadSerializer
+        elif self.action == 'retrieve':
+            serializer_class = PostReadSerializer
         return serializer_class
 
     def get_permissions(self):
@@ -44,50 +142,108 @@ class PostViewSet(ModelViewSet):
         # изменять и удалять только автор
         elif self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdmin()]
+        elif self.action == 'export':
+            return [IsAdminUser()]
         # просматривать могут все
         return []
 
+    # api/v1/posts/search/?q=...
+    @action(['GET'], detail=False)
+    def search(self, request):
+        ranked, tokens = search_posts(request.query_params.get('q', ''))
+        page = self.paginate_queryset(ranked)
+        posts = self.get_queryset().in_bulk([post_id for post_id, _ in page])
+        page = [(posts[post_id], score) for post_id, score in page if post_id in posts]
+        data = self.get_serializer([post for post, _ in page], many=True).data
+        for representation, (post, score) in zip(data, page):
+            representation['score'] = round(score, 3)
+            representation['highlight'] = {
+                'title': highlight(post.title, tokens),
+                'text': highlight(post.text, tokens, snippet_length=200),
+            }
+        return self.get_paginated_response(data)
+
+    # api/v1/posts/trending/
+    @action(['GET'], detail=False)
+    def trending(self, request):
+        def get_response():
+            posts = leaderboards.trending(self.get_queryset(), leaderboards.limit_from(request))
+            return Response(self.get_serializer(posts, many=True).data)
+        return cached_response(request, ['posts'], get_response, user_flags=True)
+
+    # api/v1/posts/id/similar/
     @action(['GET'], detail=True)
+    def similar(self, request, pk=None):
+        post = self.get_object()
+
+        def get_response():
+            ids = recommendations.similar_ids(post.pk, leaderboards.limit_from(request))
+            return Response(posts_in_order(request, ids))
+        return cached_response(request, ['posts'], get_response, user_flags=True)
+
+    # api/v1/posts/id/rating_stats/
+    @action(['GET'], detail=True)
+    @post_stats_conditional
+    def rating_stats(self, request, pk=None):
+        def get_response():
+            post = get_object_or_404(Post.objects.select_related('category'), pk=pk)
+            return Response(post_rating_stats(post))
+        return cached_response(request, [f'post:{pk}', 'categories'], get_response)
+
+    @action(['GET'], detail=True)
+    @post_conditional
     def reviews(self, request, pk):
         post = self.get_object()
-        reviews = post.reviews.all()
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        # отзывов у поста может быть много: отдаём потоком, не собирая весь список в памяти
+        return streaming_json_response(iter_review_rows(post.reviews.all()))
+
+    # api/v1/posts/export/ - весь каталог в формате import_catalogue, массивом JSON
+    @action(['GET'], detail=False)
+    def export(self, request):
+        return streaming_json_response(export_posts(settings.STREAMING_JSON_CHUNK))
 
     # api/v1/posts/id/add_to_favorites/
     @action(['POST'], detail=True)
     def add_to_favorites(self, request, pk=None):
         post = self.get_object()
-        if request.user.favorited.filter(post=post).exists():
-            return Response('Фильм уже находится в избранных')
-        Favorite.objects.create(post=post, user=request.user)
+        with transaction.atomic():
+            _, created = Favorite.objects.get_or_create(post=post, user=request.user)
+            if not created:
+                return Response('Фильм уже находится в избранных')
+            Post.update_counters(post.pk, favorites_count=1)
         return Response('Добавлено в избранное')
 
     # api/v1/posts/id/remove_from_favorites/
     @action(['POST'], detail=True)
     def remove_from_favorites(self, request, pk=None):
         post = self.get_object()
-        if not request.user.favorited.filter(post=post).exists():
-            return Response('Фильм не находится в списке избранных')
-        request.user.favorited.filter(post=post).delete()
+        with transaction.atomic():
+            deleted, _ = request.user.favorited.filter(post=post).delete()
+            if not deleted:
+                return Response('Фильм не находится в списке избранных')
+            Post.update_counters(post.pk, favorites_count=-deleted)
         return Response('Фильм удалён из избранных')
 
     # api/v1/posts/id/like/
     @action(['POST'], detail=True)
     def like(self, request, pk=None):
         post = self.get_object()
-        if request.user.liked.filter(post=post).exists():
-            return Response('Фильм уже залайкан')
-        Like.objects.create(post=post, user=request.user)
+        with transaction.atomic():
+            _, created = Like.objects.get_or_create(post=post, user=request.user)
+            if not created:
+                return Response('Фильм уже залайкан')
+            Post.update_counters(post.pk, likes_count=1)
         return Response('Вы поставили лайк фильму')
 
     # api/v1/posts/id/dislike/
     @action(['POST'], detail=True)
     def dislike(self, request, pk=None):
         post = self.get_object()
-        if not request.user.liked.filter(post=post).exists():
-            return Response('Фильм не залайкан')
-        request.user.liked.filter(post=post).delete()
+        with transaction.atomic():
+            deleted, _ = request.user.liked.filter(post=post).delete()
+            if not deleted:
+                return Response('Фильм не залайкан')
+            Post.update_counters(post.pk, likes_count=-deleted)
         return Response('Вы убрали лайк с фильма')
 
 
@@ -107,29 +263,139 @@ class ReviewViewSet(CreateModelMixin,
                 return [IsAuthor()]
             # просматривать
 
+        @transaction.atomic
+        def perform_create(self, serializer):
+            review = serializer.save()
+            Post.update_counters(review.post_id, reviews_count=1, rating_sum=review.rating)
+
+        @transaction.atomic
+        def perform_update(self, serializer):
+            old_post_id, old_rating = serializer.instance.post_id, serializer.instance.rating
+            review = serializer.save()
+            if review.post_id == old_post_id:
+                Post.update_counters(review.post_id, rating_sum=review.rating - old_rating)
+                return
+            Post.update_counters(old_post_id, reviews_count=-1, rating_sum=-old_rating)
+            Post.update_counters(review.post_id, reviews_count=1, rating_sum=review.rating)
 
-class FavoritesListView(ListAPIView):
-    queryset = Favorite.objects.all()
+        @transaction.atomic
+        def perform_destroy(self, instance):
+            Post.update_counters(instance.post_id, reviews_count=-1, rating_sum=-instance.rating)
+            instance.delete()
+
+
+class FavoritesListView(InstrumentedViewMixin, ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = FavoritesListSerializer
+    pagination_class = UserPostsCursorPagination
 
-    def get(self, request):
-        data = request.data
-        serializer = FavoritesListSerializer(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return self.request.user.favorited.select_related('post').only(*SUMMARY_FIELDS)
 
 
-class LikesListView(ListAPIView):
-    queryset = Like.objects.all()
+class LikesListView(InstrumentedViewMixin, ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = LikesListSerializer
+    pagination_class = UserPostsCursorPagination
+
+    def get_queryset(self):
+        return self.request.user.liked.select_related('post').only(*SUMMARY_FIELDS)
+
+
+class VideoUploadViewSet(CreateModelMixin,
+                         RetrieveModelMixin,
+                         GenericViewSet):
+    """Загрузка трейлера частями: POST - начать, PUT с Content-Range - часть, complete - собрать."""
+    queryset = VideoUpload.objects.all()
+    serializer_class = VideoUploadSerializer
+
+    def get_permissions(self):
+        # загружать видео может только админ, и только свои загрузки
+        return [IsAuthenticated(), IsAdmin()]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    # PUT api/v1/uploads/id/  Content-Range: bytes 0-1048575/52428800, X-Chunk-SHA256: ...
+    def update(self, request, pk=None):
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if upload.video_id:
+                return Response('Загрузка уже завершена', status=409)
+            start, length = parse_content_range(request.headers.get('Content-Range'), upload)
+            if start != upload.received:
+                # клиент продолжает с received
+                return Response(self.get_serializer(upload).data, status=409)
+            write_chunk(upload, request.stream, start, length, request.headers.get('X-Chunk-SHA256', ''))
+        return Response(self.get_serializer(upload).data)
+
+    # api/v1/uploads/id/complete/
+    @action(['POST'], detail=True)
+    def complete(self, request, pk=None):
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if not upload.video_id:
+                complete_upload(upload)
+        return Response(self.get_serializer(upload).data)
+
+
+class RecommendationsView(APIView):
+    permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        data = request.data
-        serializer = LikesListSerializer(data=data, context={'request': request})
+        ids = recommendations.recommended_ids(request.user, leaderboards.limit_from(request))
+        return Response(posts_in_order(request, ids))
+
+
+class BulkToggleView(APIView):
+    """Добавляет и убирает лайки/избранное пачкой в одной транзакции."""
+    permission_classes = [IsAuthenticated]
+    model = None
+    counter = None
+
+    def post(self, request):
+        serializer = BulkToggleSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        add = serializer.validated_data['add']
+        remove = serializer.validated_data['remove']
+        requested = add | remove
+        with transaction.atomic(), batched_post_changes() as changed:
+            # блокируем посты до конца транзакции: параллельная пачка того же пользователя (повтор запроса)
+            # ждёт здесь и уже видит наши лайки, иначе обе посчитали бы один и тот же лайк в счётчике
+            found = set(Post.objects.filter(pk__in=requested).order_by('pk').select_for_update()
+                        .values_list('pk', flat=True))
+            existing = set(self.model.objects.filter(user=request.user, post_id__in=requested)
+                           .values_list('post_id', flat=True))
+            created = (add & found) - existing
+            removed = remove & existing
+            # unique_together - на случай вставки в обход этой блокировки
+            self.model.objects.bulk_create([self.model(post_id=post_id, user=request.user) for post_id in created],
+                                           ignore_conflicts=True)
+            self.model.objects.filter(user=request.user, post_id__in=removed).delete()
+            Post.objects.filter(pk__in=created).update(**Post.counter_updates(**{self.counter: 1}))
+            Post.objects.filter(pk__in=removed).update(**Post.counter_updates(**{self.counter: -1}))
+            changed.update(created, removed)
+
+        results = []
+        for post_id in sorted(requested):
+            if post_id not in found:
+                status = 'not_found'
+            elif post_id in add:
+                status = 'added' if post_id in created else 'already_added'
+            else:
+                status = 'removed' if post_id in removed else 'not_added'
+            results.append({'post': post_id, 'status': status})
+        return Response(results)
+
+
+class LikesBulkView(BulkToggleView):
+    model = Like
+    counter = 'likes_count'
+
+
+class FavoritesBulkView(BulkToggleView):
+    model = Favorite
+    counter = 'favorites_count'
 
 # TODO: celery
 # TODO: presentation